@@ -1,25 +1,44 @@
-import os
 from argparse import ArgumentParser
-from typing import List
+from typing import List, Dict, Tuple, TYPE_CHECKING
 
 import numpy as np
-from neem_interface_python.neem import NEEM
-from neem_interface_python.rosprolog_client import atom
-from neem_utils.knowrob_queries import parse_tf_traj
-from pymongo import MongoClient
-import matplotlib.pyplot as plt
 
-plt.style.use("bmh")
+from vr_neem_converter.motion_features import MotionFeatures, MOTION_FEATURES_FILENAME
+from vr_neem_converter.neem_archive import neem_file_exists, load_neem
+from vr_neem_converter.trajectory_store import TrajectorySidecar, TRAJECTORY_DIRNAME, TRAJECTORY_INDEX_FILENAME
+
+# KnowRob and matplotlib are only imported when querying KnowRob or plotting
+if TYPE_CHECKING:
+    from neem_interface_python.neem import NEEM
 
 
 class NEEMPlotter:
-    def __init__(self, neem: NEEM):
+    def __init__(self, neem: 'NEEM', neem_dir: str = None):
+        """
+        :param neem_dir: Directory or archive of the NEEM. If given, trajectories and motion features are read from the files the
+                         converter stores next to the NEEM instead of querying KnowRob
+        """
         self.neem = neem
+        self.neem_dir = neem_dir
 
-    def plot_tf(self, hand_iri: str, index_iri: str, thumb_iri: str, other_objects: List[str], compact=False):
-        objects = [hand_iri, index_iri, thumb_iri] + other_objects
-        fig, axes = plt.subplots(4, 1)
+    def _has_sidecar(self) -> bool:
+        return self.neem_dir is not None and \
+            neem_file_exists(self.neem_dir, f"{TRAJECTORY_DIRNAME}/{TRAJECTORY_INDEX_FILENAME}")
+
+    def _trajectories_from_sidecar(self, objects: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        sidecar = TrajectorySidecar(self.neem_dir)
+        object_trajs = {}
+        for object_iri in objects:
+            if object_iri not in sidecar.ranges:
+                object_trajs[object_iri] = (np.zeros((0,)), np.zeros((0, 3)), np.zeros((0, 4)))
+                continue
+            timestamps, poses = sidecar.get_trajectory(object_iri)
+            object_trajs[object_iri] = (timestamps, poses[:, :3], poses[:, 3:])
+        return object_trajs
 
+    def _trajectories_from_knowrob(self, objects: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        from neem_interface_python.rosprolog_client import atom
+        from neem_utils.knowrob_queries import parse_tf_traj
         res = self.neem.prolog.ensure_all_solutions(f"""
             kb_call(instance_of(Event,dul:'Event'))
         """)
@@ -35,29 +54,48 @@ class NEEMPlotter:
             start_time = min(start_time, event_start_time)
             end_time = max(end_time, event_end_time)
 
-        object_trajs = {object_iri: parse_tf_traj(self.neem.neem_interface.get_tf_trajectory(object_iri, start_time, end_time))
-                        for object_iri in objects}
+        object_trajs = {}
+        for object_iri in objects:
+            traj = parse_tf_traj(self.neem.neem_interface.get_tf_trajectory(object_iri, start_time, end_time))
+            object_trajs[object_iri] = (np.array([dp.timestamp for dp in traj]),
+                                        np.array([dp.pos for dp in traj]).reshape((-1, 3)),
+                                        np.array([dp.ori.as_quat() for dp in traj]).reshape((-1, 4)))
+        return object_trajs
+
+    def plot_tf(self, hand_iri: str, index_iri: str, thumb_iri: str, other_objects: List[str], compact=False):
+        import matplotlib.pyplot as plt
+        plt.style.use("bmh")
+        objects = [hand_iri, index_iri, thumb_iri] + other_objects
+        fig, axes = plt.subplots(4, 1)
+
+        if self._has_sidecar():
+            object_trajs = self._trajectories_from_sidecar(objects)
+        else:
+            object_trajs = self._trajectories_from_knowrob(objects)
 
         # Object positions
-        for object_iri, object_traj in object_trajs.items():
-            if len(object_traj) == 0:
+        for object_iri, (timestamps, positions, orientations) in object_trajs.items():
+            if len(timestamps) == 0:
                 continue
-            first_pos = object_traj[0].pos
-            first_ori = object_traj[0].ori.as_quat()
+            first_pos = positions[0]
+            first_ori = orientations[0]
             print(f"Object {object_iri}: {first_pos[0]:.4f} {first_pos[1]:.4f} {first_pos[2]:.4f} {first_ori[0]:.4f} {first_ori[1]:.4f} {first_ori[2]:.4f} {first_ori[3]:.4f}")
-            timestamps = [dp.timestamp for dp in object_traj]
             for dim in range(3):
-                data = [dp.pos[dim] for dp in object_traj]
-                axes[dim].plot(timestamps, data)
+                axes[dim].plot(timestamps, positions[:, dim])
 
         # Gripper opening
-        gripper_openings = []
-        gripper_timestamps = []
-        thumb_traj = object_trajs[thumb_iri]
-        index_traj = object_trajs[index_iri]
-        for i in range(len(thumb_traj)):
-            gripper_openings.append(np.linalg.norm(np.array(thumb_traj[i].pos) - np.array(index_traj[i].pos)))
-            gripper_timestamps.append(thumb_traj[i].timestamp)
+        gripper_timestamps = None
+        if self._has_sidecar() and neem_file_exists(self.neem_dir, MOTION_FEATURES_FILENAME):
+            try:
+                gripper_timestamps, gripper_openings = MotionFeatures(self.neem_dir).aperture(hand_iri)
+            except (KeyError, ValueError):  # No precomputed aperture for this hand
+                pass
+        if gripper_timestamps is None:
+            thumb_timestamps, thumb_positions, _ = object_trajs[thumb_iri]
+            _, index_positions, _ = object_trajs[index_iri]
+            num_samples = min(len(thumb_positions), len(index_positions))
+            gripper_openings = np.linalg.norm(thumb_positions[:num_samples] - index_positions[:num_samples], axis=1)
+            gripper_timestamps = thumb_timestamps[:num_samples]
         axes[3].plot(gripper_timestamps, gripper_openings)
 
         if compact:
@@ -69,7 +107,7 @@ class NEEMPlotter:
 
 
 def main(args):
-    plotter = NEEMPlotter(NEEM.load(args.neem_path))
+    plotter = NEEMPlotter(load_neem(args.neem_path), neem_dir=args.neem_path)
     plotter.plot_tf(index_iri="http://knowrob.org/kb/ameva_log.owl#azTP7YBRGU-4YZb08OoOmA",  # Index finger
                     thumb_iri="http://knowrob.org/kb/ameva_log.owl#11vAk9_Mb0q6TURP_Z4teQ",  # Thumb
                     hand_iri="http://knowrob.org/kb/ameva_log.owl#tC3DKRxnmkqDhmI0MluPuA",   # Hand
@@ -0,0 +1,40 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import pytest
+
+from vr_neem_converter.catalog import DumpCatalog
+
+
+@pytest.fixture
+def vr_neem_dir(tmp_path):
+    (tmp_path / "dump" / "ameva").mkdir(parents=True)
+    (tmp_path / "SemLog" / "ep_1").mkdir(parents=True)
+    (tmp_path / "SemLog" / "ep_10").mkdir(parents=True)
+    for name in ["ep_1", "ep_10"]:
+        (tmp_path / "dump" / "ameva" / f"{name}.bson").write_bytes(b"\0")
+        (tmp_path / "SemLog" / name / f"{name}_ED.owl").write_text("<rdf:RDF/>")
+    return tmp_path
+
+
+def test_episodes_match_exactly(vr_neem_dir):
+    catalog = DumpCatalog.load_or_build(str(vr_neem_dir))
+    assert catalog.episode_names() == ["ep_1", "ep_10"]
+    assert catalog.episode("ep_1").event_owl.path.endswith("ep_1_ED.owl")
+    with pytest.raises(KeyError):
+        catalog.episode("ep")
+
+
+def test_missing_semantic_map(vr_neem_dir):
+    catalog = DumpCatalog.load_or_build(str(vr_neem_dir))
+    with pytest.raises(FileNotFoundError):
+        catalog.semantic_map_file()
+    (vr_neem_dir / "SemLog" / "SemanticMap").mkdir()
+    (vr_neem_dir / "SemLog" / "SemanticMap" / "SM.owl").write_text("<rdf:RDF/>")
+    assert DumpCatalog.load_or_build(str(vr_neem_dir)).semantic_map_file().path.endswith("SM.owl")
+
+
+def test_unwritable_cache(vr_neem_dir):
+    # E.g. a read-only mount of the dump
+    catalog = DumpCatalog.load_or_build(str(vr_neem_dir), str(vr_neem_dir / "missing_dir" / "neem_catalog.json"))
+    assert catalog.episode_names() == ["ep_1", "ep_10"]
@@ -0,0 +1,78 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+# Golden fixtures: test/golden/<episode>/live_statistics.json, saved with
+#   python scripts/compare_neem_dumps.py <live NEEM> --save_statistics test/golden/<episode>/live_statistics.json
+# from the NEEM of the episode converted via KnowRob, and test/golden/<episode>/offline, the same episode converted
+# with --offline by the current code. Regenerate the offline NEEM whenever the offline backend changes.
+GOLDEN_DIR = Path(__file__).parent / "golden"
+GOLDEN_EPISODES = sorted(path for path in GOLDEN_DIR.glob("*") if (path / "live_statistics.json").is_file())
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+DUL = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"
+
+
+def _compare_neem_dumps():
+    pytest.importorskip("bson")
+    from vr_neem_converter.scripts import compare_neem_dumps
+    return compare_neem_dumps
+
+
+def _write_neem(neem_dir: Path, triples: list, tf: list):
+    (neem_dir / "roslog").mkdir(parents=True)
+    for collection_name, documents in [("triples", triples), ("tf", tf)]:
+        with open(neem_dir / "roslog" / f"{collection_name}.json", "w") as collection_file:
+            for document in documents:
+                collection_file.write(json.dumps(document) + "\n")
+
+
+def _triple(s: str, p: str, o) -> dict:
+    return {"s": s, "p": p, "o": o, "p*": [p], "o*": [o], "graph": "user"}
+
+
+def _tf(frame: str, millis: int) -> dict:
+    return {"child_frame_id": frame, "header": {"frame_id": "world", "stamp": {"$date": {"$numberLong": str(millis)}}},
+            "transform": {"translation": {"x": 0.0, "y": 1, "z": 2.5},
+                          "rotation": {"x": 0.0, "y": 0.0, "z": 0.0, "w": 1.0}}}
+
+
+def _episode(action_iri: str) -> list:
+    return [_triple(action_iri, RDF_TYPE, DUL + "Action"), _triple(action_iri, DUL + "hasParticipant", "Cup_1")]
+
+
+def test_iris_are_ignored(tmp_path):
+    compare_neem_dumps = _compare_neem_dumps()
+    _write_neem(tmp_path / "live", _episode(DUL + "Action_abc"), [_tf("Cup_1", 1000), _tf("Cup_1", 1100)])
+    _write_neem(tmp_path / "offline", _episode(DUL + "Action_xyz"), [_tf("Cup_1", 1000), _tf("Cup_1", 1200)])
+    assert compare_neem_dumps.compare_statistics(compare_neem_dumps.neem_statistics(tmp_path / "live"),
+                                                 compare_neem_dumps.neem_statistics(tmp_path / "offline")) == 0
+
+
+def test_layout_differences(tmp_path):
+    compare_neem_dumps = _compare_neem_dumps()
+    live_triples = _episode(DUL + "Action_abc")
+    offline_triples = _episode(DUL + "Action_xyz")
+    del offline_triples[1]["graph"]
+    _write_neem(tmp_path / "live", live_triples, [_tf("Cup_1", 1000)])
+    _write_neem(tmp_path / "offline", offline_triples, [_tf("Cup_1", 1000)])
+    live_stats = compare_neem_dumps.neem_statistics(tmp_path / "live")
+    # Through a statistics file, as for golden fixtures
+    with open(tmp_path / "live_statistics.json", "w") as statistics_file:
+        json.dump(live_stats, statistics_file)
+    assert compare_neem_dumps.load_statistics(tmp_path / "live_statistics.json") == live_stats
+    assert compare_neem_dumps.compare_statistics(live_stats,
+                                                 compare_neem_dumps.neem_statistics(tmp_path / "offline")) == 2
+
+
+@pytest.mark.skipif(len(GOLDEN_EPISODES) == 0, reason="No golden episodes in test/golden")
+@pytest.mark.parametrize("episode_dir", GOLDEN_EPISODES, ids=lambda path: path.name)
+def test_golden_episodes(episode_dir: Path):
+    compare_neem_dumps = _compare_neem_dumps()
+    live_stats = compare_neem_dumps.load_statistics(episode_dir / "live_statistics.json")
+    assert compare_neem_dumps.compare_statistics(live_stats, compare_neem_dumps.neem_statistics(
+        episode_dir / "offline")) == 0
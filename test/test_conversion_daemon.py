@@ -0,0 +1,55 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import os
+import time
+from concurrent.futures import Future
+
+from vr_neem_converter.conversion_daemon import ConversionDaemon
+
+
+def _write_dump(dump_dir: str, content: str):
+    os.makedirs(os.path.join(dump_dir, "dump"), exist_ok=True)
+    with open(os.path.join(dump_dir, "dump", "tf.bson"), "w") as dump_file:
+        dump_file.write(content)
+
+
+def _start(daemon: ConversionDaemon) -> Future:
+    """
+    Move the first queued job to the running jobs, as _dispatch does, without a worker process
+    """
+    future = Future()
+    job = daemon.queue.popleft()
+    job.started = time.time()
+    daemon.running[future] = job
+    return future
+
+
+def test_dump_changed_while_converting(tmp_path):
+    dump_dir = str(tmp_path / "input" / "demo_1")
+    _write_dump(dump_dir, "first")
+    daemon = ConversionDaemon(str(tmp_path / "input"), str(tmp_path / "output"), "config.json", concurrency=2,
+                              offline=True)
+    daemon.poll()
+    daemon.poll()
+    assert [job.dump_dir for job in daemon.queue] == [dump_dir]
+    future = _start(daemon)
+
+    # Copying the dump continues while its first version is being converted
+    _write_dump(dump_dir, "first and second")
+    daemon.poll()
+    daemon.poll()
+    assert len(daemon.queue) == 0
+
+    future.set_result([])
+    daemon._collect([future])
+    daemon.poll()
+    assert [job.dump_dir for job in daemon.queue] == [dump_dir]
+    assert daemon.queue[0].signature[1] == len("first and second")
+
+    # Unchanged after the second conversion: not queued again
+    future = _start(daemon)
+    future.set_result([])
+    daemon._collect([future])
+    daemon.poll()
+    assert len(daemon.queue) == 0
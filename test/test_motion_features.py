@@ -0,0 +1,47 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import numpy as np
+import pytest
+
+from vr_neem_converter.motion_features import compute_motion_features, linear_velocity, angular_velocity, \
+    MotionFeatures
+from vr_neem_converter.skeleton import SkeletonLookup, THUMB_TIP_IDX, INDEX_TIP_IDX
+from vr_neem_converter.trajectory_store import TrajectoryWriter
+
+HAND = "http://knowrob.org/kb/ameva_log.owl#RightHand"
+THUMB = "http://knowrob.org/kb/ameva_log.owl#RightHandThumb3"
+INDEX = "http://knowrob.org/kb/ameva_log.owl#RightHandIndex3"
+CUP = "http://knowrob.org/kb/ameva_log.owl#Cup"
+
+
+def _datapoints(frame: str, timestamps: np.ndarray, offset: float) -> list:
+    Datapoint = pytest.importorskip("neem_interface_python.utils.utils").Datapoint
+    return [Datapoint.from_unreal(ts, frame, "world", [100.0 * ts + offset, 20.0 * ts ** 2, -5.0],
+                                  [0.0, 0.0, np.sin(ts / 2), np.cos(ts / 2)])
+            for ts in timestamps]
+
+
+def test_motion_features(tmp_path):
+    trajectories = {HAND: _datapoints(HAND, np.linspace(0.0, 2.0, 21), 0.0),
+                    THUMB: _datapoints(THUMB, np.linspace(0.0, 2.0, 11), 1.0),
+                    INDEX: _datapoints(INDEX, np.linspace(0.05, 2.05, 11), 3.0),
+                    CUP: _datapoints(CUP, np.linspace(0.0, 2.0, 5), 50.0)}
+    with TrajectoryWriter(str(tmp_path)) as writer:
+        for datapoints in trajectories.values():
+            writer.append(datapoints)
+    skeleton = SkeletonLookup({"http://knowrob.org/kb/knowrob.owl#GenesisRightHand": HAND},
+                              {HAND: [(THUMB_TIP_IDX, THUMB), (INDEX_TIP_IDX, INDEX)]})
+    compute_motion_features(str(tmp_path), skeleton, [CUP])
+
+    features = MotionFeatures(str(tmp_path))
+    assert features.hands == [HAND] and features.objects == [CUP]
+    for frame in trajectories.keys():
+        timestamps, poses = features.sidecar.get_trajectory(frame)
+        feature_timestamps, linear, angular = features.velocity(frame)
+        np.testing.assert_allclose(feature_timestamps, timestamps)
+        np.testing.assert_allclose(linear, linear_velocity(timestamps, poses[:, :3]), rtol=1e-5)
+        np.testing.assert_allclose(angular, angular_velocity(timestamps, poses[:, 3:]), rtol=1e-5, atol=1e-6)
+    assert len(features.aperture(HAND)[0]) == len(trajectories[THUMB])
+    timestamps, distances = features.hand_object_distance(HAND, CUP)
+    assert len(timestamps) == len(trajectories[HAND]) and np.all(distances > 0)
@@ -0,0 +1,114 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import io
+import os
+import tarfile
+
+import numpy as np
+import pytest
+
+from vr_neem_converter.manifest import create_manifest, write_manifest, read_manifest
+from vr_neem_converter.neem_archive import NEEMArchive, write_neem_archive, neem_archive_path, read_neem_file, \
+    neem_file_exists, ARCHIVE_INDEX_SUFFIX, CHUNK_SIZE
+from vr_neem_converter.trajectory_store import TrajectoryWriter, TrajectorySidecar
+
+# Longer than the 100 characters of a ustar name field, so that it needs a PAX extended header
+LONG_PATH = "roslog/" + "/".join(["nested_directory_with_a_long_name"] * 4) + "/triples.json"
+
+
+def _write_neem(neem_dir: str) -> dict:
+    """
+    Return the content of each file of the NEEM, by path relative to neem_dir
+    """
+    rng = np.random.default_rng(0)
+    files = {
+        "roslog/triples.json": b'{"s": "a", "p": "b", "o": "c"}\n' * 1000,
+        LONG_PATH: b'{"s": "d", "p": "e", "o": "f"}\n',
+        "empty.txt": b"",
+        "trajectories/blob.bin": rng.bytes(2 * CHUNK_SIZE + 123),  # Spans several chunks, incompressible
+    }
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(neem_dir, path)), exist_ok=True)
+        with open(os.path.join(neem_dir, path), "wb") as f:
+            f.write(content)
+    write_manifest(neem_dir, create_manifest({"collection": "abc"}))
+    with open(os.path.join(neem_dir, "manifest.json"), "rb") as f:
+        files["manifest.json"] = f.read()
+    return files
+
+
+@pytest.fixture
+def neem(tmp_path):
+    pytest.importorskip("zstandard")
+    neem_dir = str(tmp_path / "episode_1")
+    files = _write_neem(neem_dir)
+    archive_path = neem_archive_path(neem_dir)
+    write_neem_archive(neem_dir, archive_path)
+    return neem_dir, archive_path, files
+
+
+def test_round_trip(neem):
+    _, archive_path, files = neem
+    archive = NEEMArchive(archive_path)
+    assert archive.member_names() == sorted(files.keys())
+    assert archive.members[LONG_PATH].header_size > tarfile.BLOCKSIZE  # PAX extended header before the ustar header
+    for path, content in files.items():
+        assert archive.read_member(path) == content
+        assert b"".join(archive.iter_member(path, chunk_size=1000)) == content
+        assert neem_file_exists(archive_path, path)
+    assert not neem_file_exists(archive_path, "missing.txt")
+    with pytest.raises(KeyError):
+        archive.read_member("missing.txt")
+
+
+def test_standard_tar(neem):
+    # The archive is a regular zstd-compressed tar, as read by tar --zstd -xf
+    zstandard = pytest.importorskip("zstandard")
+    _, archive_path, files = neem
+    with open(archive_path, "rb") as archive_file:
+        tar_data = zstandard.ZstdDecompressor().stream_reader(archive_file, read_across_frames=True).read()
+    contents = {}
+    with tarfile.open(fileobj=io.BytesIO(tar_data), mode="r:") as tar:
+        for tarinfo in tar:
+            assert tarinfo.name.startswith("episode_1/")
+            contents[tarinfo.name[len("episode_1/"):]] = tar.extractfile(tarinfo).read()
+    assert contents == files
+
+
+def test_index_rebuild(neem):
+    _, archive_path, files = neem
+    index_path = archive_path + ARCHIVE_INDEX_SUFFIX
+    members = {path: member.to_dict() for path, member in NEEMArchive(archive_path).members.items()}
+    os.remove(index_path)
+
+    archive = NEEMArchive(archive_path)
+    assert {path: member.to_dict() for path, member in archive.members.items()} == members
+    assert os.path.exists(index_path)
+    assert archive.read_member(LONG_PATH) == files[LONG_PATH]
+    assert archive.read_member("empty.txt") == b""
+
+
+def test_read_manifest(neem):
+    neem_dir, archive_path, _ = neem
+    assert read_manifest(archive_path) == read_manifest(neem_dir)
+    assert read_neem_file(archive_path, "empty.txt") == b""
+
+
+def test_trajectory_sidecar(tmp_path):
+    pytest.importorskip("zstandard")
+    Datapoint = pytest.importorskip("neem_interface_python.utils.utils").Datapoint
+    neem_dir = str(tmp_path / "episode_1")
+    with TrajectoryWriter(neem_dir) as writer:
+        writer.append([Datapoint.from_unreal(ts, frame, "world", [100.0 * ts, 0.0, 0.0], [0.0, 0.0, 0.0, 1.0])
+                       for frame in ["Cup", "Plate"] for ts in [0.0, 0.5, 1.0]])
+    archive_path = neem_archive_path(neem_dir)
+    write_neem_archive(neem_dir, archive_path)
+
+    from_dir = TrajectorySidecar(neem_dir)
+    from_archive = TrajectorySidecar(archive_path)
+    assert from_archive.frames == from_dir.frames
+    for frame in from_dir.frames:
+        for expected, actual in zip(from_dir.get_trajectory(frame, 0.2, 1.0),
+                                    from_archive.get_trajectory(frame, 0.2, 1.0)):
+            np.testing.assert_array_equal(actual, expected)
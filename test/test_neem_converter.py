@@ -0,0 +1,16 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import os
+
+import pytest
+
+from vr_neem_converter.neem_converter import VRNEEMConverter
+
+
+@pytest.mark.parametrize("start_time, end_time", [(5.0, 5.0), (10.0, 2.5)])
+def test_invalid_time_window(tmp_path, start_time, end_time):
+    output_dir = str(tmp_path / "neems")
+    with pytest.raises(ValueError):
+        VRNEEMConverter(str(tmp_path)).convert(output_dir, start_time=start_time, end_time=end_time)
+    assert not os.path.exists(output_dir)
@@ -0,0 +1,123 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+
+import pytest
+
+from vr_neem_converter.offline_backend import OfflineKnowledgeBase, OfflineNEEMInterface, OfflineEpisode, \
+    OfflinePrologException, RDF_TYPE, DUL, SOMA, KNOWROB, KNOWROB_INDUSTRIAL
+
+OBJ = "http://knowrob.org/kb/supermarket.owl#ShoppingBasket_1"
+HAND = "http://knowrob.org/kb/ameva_log.owl#RightHand_1"
+AGENT = "http://knowrob.org/kb/vr_agent.owl#VRAgent_0"
+SITUATION_RELATIONS = {"object_grasped_in_situation": KNOWROB_INDUSTRIAL + "GraspRelation"}
+
+CLASS_OWL = """<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"
+         xmlns:owl="http://www.w3.org/2002/07/owl#"
+         xml:base="http://knowrob.org/kb/knowrob.owl">
+  <owl:Ontology rdf:about="http://knowrob.org/kb/knowrob.owl"/>
+  <owl:Class rdf:about="http://knowrob.org/kb/knowrob.owl#Container"/>
+  <owl:Class rdf:about="http://knowrob.org/kb/knowrob.owl#ShoppingBasket">
+    <rdfs:subClassOf rdf:resource="http://knowrob.org/kb/knowrob.owl#Container"/>
+  </owl:Class>
+</rdf:RDF>
+"""
+
+
+def _episode(tmp_path, offline_config: dict = None) -> OfflineEpisode:
+    return OfflineEpisode(OfflineNEEMInterface(offline_config), "http://www.artiminds.com/kb/artm.owl#PickAndPlaceTask",
+                          str(tmp_path / "env.owl"), "http://knowrob.org/kb/supermarket.owl#Supermarket",
+                          "env.urdf", str(tmp_path / "agent.owl"), AGENT, "agent.urdf", str(tmp_path / "neem"))
+
+
+def test_projections_of_converter():
+    # Query strings as sent by VRNEEMConverter._assert_objects_and_agent, _assert_geometry_for_individual and
+    # EventConverter
+    kb = OfflineKnowledgeBase(situation_relations=SITUATION_RELATIONS)
+    kb.ensure_once(f"""
+                kb_project([
+                    is_individual('{OBJ}'), instance_of('{OBJ}', '{KNOWROB}ShoppingBasket')
+                ])
+            """)
+    kb.ensure_once(f"""
+                    kb_project([
+                        has_participant('{OBJ}', '{DUL}Action_1')
+                    ])
+                """)
+    kb.ensure_once(f"kb_project(has_kinematics_file('{OBJ}', 'package://ilias/urdf/basket.urdf', 'URDF'))")
+    shape_iri = kb.ensure_once("kb_project(new_iri(S, soma:'Shape'))")["S"]
+    kb.ensure_once(f"kb_project(holds('{OBJ}', soma:'hasShape', '{shape_iri}'))")
+    region_iri = kb.ensure_once("kb_project(new_iri(SR, soma:'ShapeRegion'))")["SR"]
+    kb.ensure_once(f"kb_project(holds('{shape_iri}', dul:'hasRegion', '{region_iri}'))")
+    kb.ensure_once(f"kb_project(holds('{region_iri}', soma:'hasWidth', 0.35))")
+    situation_iri = kb.add_individual(DUL + "Situation")
+    kb.ensure_once(f"""
+            kb_project(object_grasped_in_situation('{OBJ}', '{HAND}', '{situation_iri}'))
+        """)
+
+    assert shape_iri.startswith(SOMA + "Shape_") and region_iri.startswith(SOMA + "ShapeRegion_")
+    assert (OBJ, RDF_TYPE, KNOWROB + "ShoppingBasket") in kb.triples
+    assert (OBJ, DUL + "hasParticipant", DUL + "Action_1") in kb.triples
+    assert (OBJ, KNOWROB + "hasKinematicsFileFormat", "URDF") in kb.triples
+    assert (region_iri, SOMA + "hasWidth", 0.35) in kb.triples
+    assert kb.all_solutions(f"holds('{OBJ}', soma:'hasShape', S), holds(S, dul:'hasRegion', R)") == \
+        [{"S": shape_iri, "R": region_iri}]
+    relation_iri = kb.ensure_once(f"holds('{situation_iri}', dul:'satisfies', R)")["R"]
+    assert (relation_iri, RDF_TYPE, KNOWROB_INDUSTRIAL + "GraspRelation") in kb.triples
+    assert {x["O"] for x in kb.all_solutions(f"holds('{relation_iri}', dul:'isRelatedToConcept', O)")} == {OBJ, HAND}
+
+
+def test_situation_relations_must_be_configured():
+    kb = OfflineKnowledgeBase()
+    situation_iri = kb.add_individual(DUL + "Situation")
+    with pytest.raises(OfflinePrologException):
+        kb.ensure_once(f"kb_project(object_grasped_in_situation('{OBJ}', '{HAND}', '{situation_iri}'))")
+
+
+def test_situation_queries_of_converter(tmp_path):
+    utils = pytest.importorskip("vr_neem_converter.utils")
+    with _episode(tmp_path) as episode:
+        neem_interface = episode.neem_interface
+        situations = {}
+        for name, start_time, end_time in [("grasp", 1.0, 3.0), ("contact", 2.0, 5.0)]:
+            state_iri = neem_interface.assert_state([AGENT, OBJ], start_time, end_time, state_type=SOMA + "GraspState")
+            situations[name] = neem_interface.assert_situation(AGENT, [OBJ])
+            neem_interface.prolog.ensure_once(
+                f"kb_project(holds('{situations[name]}', 'http://www.ease-crc.org/ont/SOMA.owl#manifestsIn', "
+                f"'{state_iri}'))")
+            res = neem_interface.prolog.ensure_once(f"kb_call(has_time_interval('{state_iri}', StartTime, EndTime))")
+            assert (float(res["StartTime"]), float(res["EndTime"])) == (start_time, end_time)
+
+        assert utils.get_initial_situations(neem_interface, 1.0) == [situations["grasp"]]
+        assert utils.get_initial_situations(neem_interface, 3.0) == [situations["contact"]]
+        assert set(utils.get_initial_situations(neem_interface, 2.5)) == set(situations.values())
+        assert utils.get_terminal_situations(neem_interface, 2.9) == [situations["contact"]]
+        assert set(utils.get_runtime_situations(neem_interface, 2.0, 3.0)) == set(situations.values())
+        assert utils.get_runtime_situations(neem_interface, 0.0, 1.0) == []
+
+
+def test_known_classes(tmp_path):
+    pytest.importorskip("vr_neem_converter.utils")  # For loading ontologies
+    (tmp_path / "knowrob.owl").write_text(CLASS_OWL)
+    (tmp_path / "known_classes.json").write_text(json.dumps([SOMA + "GraspState"]))
+    with _episode(tmp_path, {"ontologies": [str(tmp_path / "knowrob.owl")],
+                             "known_classes": str(tmp_path / "known_classes.json")}) as episode:
+        kb = episode.neem_interface.prolog
+        known_classes = {x["Class"] for x in kb.all_solutions("is_class(Class)")}
+        assert {KNOWROB + "ShoppingBasket", KNOWROB + "Container", SOMA + "GraspState"}.issubset(known_classes)
+        assert KNOWROB + "Container" in kb.ancestors(KNOWROB + "ShoppingBasket")
+
+
+def test_tf_rotation(tmp_path):
+    Datapoint = pytest.importorskip("neem_interface_python.utils.utils").Datapoint
+    datapoint = Datapoint.from_unreal(1.5, HAND, "world", [100.0, 0.0, 0.0], [0.0, 0.0, 0.0, 1.0])
+    with _episode(tmp_path) as episode:
+        episode.neem_interface.assert_tf_trajectory([datapoint])
+    with open(tmp_path / "neem" / "roslog" / "tf.json") as tf_file:
+        document = json.loads(tf_file.readline())
+    rotation = document["transform"]["rotation"]
+    assert [rotation["x"], rotation["y"], rotation["z"], rotation["w"]] == pytest.approx(datapoint.ori.as_quat())
+    assert document["child_frame_id"] == HAND
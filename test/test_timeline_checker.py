@@ -0,0 +1,135 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+
+import pytest
+
+from vr_neem_converter.timeline_checker import ActionRecord, check_timeline, timeline_from_triples, RDF_TYPE, DUL, \
+    SOMA
+
+ACTIONS = [ActionRecord(DUL + "Action_A", 0.0, 1.0, [], ["s1", "s2"]),
+           ActionRecord(DUL + "Action_B", 1.0, 2.0, ["s1", "s2"], ["s3"]),
+           ActionRecord(DUL + "Action_C", 2.5, 3.0, ["s4"], [])]
+STATES = [(SOMA + "GraspState_1", 0.5, 1.5), (SOMA + "ContactState_1", 1.5, 3.5)]
+
+
+def _kinds(report) -> list:
+    return sorted((violation.kind, violation.subjects[-1]) for violation in report.violations)
+
+
+def test_consistent_timeline():
+    actions = [ActionRecord("A", 0.0, 1.0, ["x"], ["s1"]),
+               ActionRecord("B", 1.0, 2.0, ["s1"], ["s2"]),
+               ActionRecord("C", 2.0, 3.0, ["s2"], [])]
+    report = check_timeline(actions, [("state_1", 0.5, 1.5), ("state_2", 1.5, 3.0)])
+    assert report.is_consistent, report.violations
+    assert (report.num_actions, report.num_states) == (3, 2)
+
+
+def test_consistent_timeline_with_duplicates_and_multiple_situations():
+    b = ActionRecord("B", 1.0, 2.0, ["s1", "s3"], ["s2"])
+    actions = [ActionRecord("A", 0.0, 1.0, [], ["s3", "s1"]), b, b, ActionRecord("C", 2.0, 3.0, ["s2"], ["y"])]
+    assert check_timeline(actions, []).is_consistent
+
+
+def test_missing_situations():
+    actions = [ActionRecord("A", 0.0, 1.0, ["x"], ["s1", "s3"]),
+               ActionRecord("B", 1.0, 2.0, ["s1", "s4"], ["s2"]),
+               ActionRecord("C", 2.0, 3.0, ["s2"], [])]
+    assert _kinds(check_timeline(actions, [])) == [("missing_initial_situation", "s3"),
+                                                   ("missing_terminal_situation", "s4")]
+
+
+def test_gaps_overlaps_and_uncovered_states():
+    actions = [ActionRecord("A", 0.0, 1.0, [], []),
+               ActionRecord("B", 1.5, 2.5, [], []),
+               ActionRecord("C", 2.0, 3.0, [], []),
+               ActionRecord("D", 4.0, 3.5, [], [])]
+    report = check_timeline(actions, [("state_1", -1.0, 0.5), ("state_2", 1.0, 2.0)])
+    kinds = [violation.kind for violation in report.violations]
+    assert sorted(kinds) == ["gap", "gap", "invalid_interval", "overlap", "uncovered_state"]
+    assert report.violations[0].kind == "uncovered_state"  # Sorted by time
+
+
+def _records(actions: list) -> list:
+    return sorted((action.iri, action.start_time, action.end_time, action.initial_situations,
+                   action.terminal_situations) for action in actions)
+
+
+def _violations(report) -> list:
+    return [(violation.kind, violation.subjects) for violation in report.violations]
+
+
+def _triple(s: str, p: str, o, o_star: list = None) -> dict:
+    return {"s": s, "p": p, "o": o, "o*": o_star if o_star is not None else [o]}
+
+
+def test_timeline_from_triples():
+    # Time intervals on the event itself, states recognized by their superclasses, several SituationTransitions
+    # manifesting in one action and SituationTransitions manifesting in states
+    triples = [_triple("A", RDF_TYPE, DUL + "Action"), _triple("A", SOMA + "hasIntervalBegin", 0.0),
+               _triple("A", SOMA + "hasIntervalEnd", 1.0),
+               _triple("B", RDF_TYPE, DUL + "Action"), _triple("B", SOMA + "hasIntervalBegin", "1.0"),
+               _triple("B", SOMA + "hasIntervalEnd", "2.0"),
+               _triple("S", RDF_TYPE, "http://example.org#HoldingState", ["http://example.org#HoldingState",
+                                                                          SOMA + "State"]),
+               _triple("S", SOMA + "hasIntervalBegin", 0.5), _triple("S", SOMA + "hasIntervalEnd", 1.5),
+               _triple("NoInterval", RDF_TYPE, DUL + "Action")]
+    for transition, event, initial, terminal in [("T1", "A", [], ["s1"]), ("T2", "B", ["s1"], ["s2"]),
+                                                 ("T3", "B", ["s1", "s3"], ["s2"]), ("T4", "S", ["x"], ["y"]),
+                                                 ("T5", "NoInterval", [], [])]:
+        triples.append(_triple(transition, RDF_TYPE, SOMA + "SituationTransition"))
+        triples.append(_triple(transition, SOMA + "manifestsIn", event))
+        triples += [_triple(transition, SOMA + "hasInitialSituation", situation) for situation in initial]
+        triples += [_triple(transition, SOMA + "hasTerminalSituation", situation) for situation in terminal]
+    actions, states = timeline_from_triples(triples)
+    assert _records(actions) == [("A", 0.0, 1.0, [], ["s1"]), ("B", 1.0, 2.0, ["s1", "s3"], ["s2"])]
+    assert states == [("S", 0.5, 1.5)]
+    assert _violations(check_timeline(actions, states)) == [("missing_terminal_situation", ["A", "B", "s3"])]
+
+
+def _offline_triples():
+    """
+    Triples of ACTIONS and STATES as written by the offline backend
+    """
+    pytest.importorskip("vr_neem_converter.utils")  # OfflineKnowledgeBase loads ontologies via utils
+    from vr_neem_converter.offline_backend import OfflineKnowledgeBase
+    kb = OfflineKnowledgeBase()
+    for action in ACTIONS:
+        kb.add_triple(action.iri, RDF_TYPE, DUL + "Action")
+        kb.set_time_interval(action.iri, action.start_time, action.end_time)
+        transition_iri = kb.add_individual(SOMA + "SituationTransition")
+        kb.add_triple(transition_iri, SOMA + "manifestsIn", action.iri)
+        for situation in action.initial_situations:
+            kb.add_triple(transition_iri, SOMA + "hasInitialSituation", situation)
+        for situation in action.terminal_situations:
+            kb.add_triple(transition_iri, SOMA + "hasTerminalSituation", situation)
+    for state_iri, start_time, end_time in STATES:
+        kb.add_triple(state_iri, RDF_TYPE, state_iri.rsplit("_", 1)[0])
+        kb.set_time_interval(state_iri, start_time, end_time)
+    return list(kb.triple_documents())
+
+
+def test_timeline_from_offline_triples():
+    actions, states = timeline_from_triples(_offline_triples())
+    assert _records(actions) == _records(ACTIONS)
+    assert sorted(states) == sorted(STATES)
+    assert _violations(check_timeline(actions, states)) == _violations(check_timeline(ACTIONS, STATES))
+
+
+def test_check_neem_timeline(tmp_path):
+    triples = _offline_triples()
+    pytest.importorskip("bson")
+    pytest.importorskip("zstandard")
+    from vr_neem_converter.neem_archive import write_neem_archive, neem_archive_path
+    from vr_neem_converter.scripts.check_neem_timeline import load_triples
+    neem_dir = tmp_path / "episode_1"
+    (neem_dir / "roslog").mkdir(parents=True)
+    with open(neem_dir / "roslog" / "triples.json", "w") as triples_file:
+        for triple in triples:
+            triples_file.write(json.dumps(triple) + "\n")
+    archive_path = neem_archive_path(str(neem_dir))
+    write_neem_archive(str(neem_dir), archive_path)
+    assert list(load_triples(neem_dir)) == triples
+    assert list(load_triples(archive_path)) == triples
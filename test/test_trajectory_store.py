@@ -0,0 +1,48 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import numpy as np
+import pytest
+
+from vr_neem_converter.trajectory_store import TrajectoryWriter, TrajectorySidecar
+
+
+def _datapoints(frame: str, timestamps: list) -> list:
+    """
+    Real neem_interface_python Datapoints, whose orientation is a scipy Rotation
+    """
+    Datapoint = pytest.importorskip("neem_interface_python.utils.utils").Datapoint
+    return [Datapoint.from_unreal(ts, frame, "world", [100.0 * ts, 20.0, -5.0 * ts],
+                                  [0.0, 0.0, np.sin(ts / 2), np.cos(ts / 2)])
+            for ts in timestamps]
+
+
+def test_datapoints_round_trip(tmp_path):
+    hand = _datapoints("http://knowrob.org/kb/ameva_log.owl#RightHand", [0.0, 0.1, 0.2, 0.3])
+    cup = _datapoints("http://knowrob.org/kb/ameva_log.owl#Cup", [0.05, 0.15])
+    with TrajectoryWriter(str(tmp_path)) as writer:
+        # Interleaved batches, out of order within a frame, as they arrive from _assert_tf
+        writer.append(hand[2:] + cup[1:])
+        writer.append(hand[:2] + cup[:1])
+
+    sidecar = TrajectorySidecar(str(tmp_path))
+    for datapoints in [hand, cup]:
+        frame = datapoints[0].frame
+        timestamps, poses = sidecar.get_trajectory(frame)
+        np.testing.assert_allclose(timestamps, [dp.timestamp for dp in datapoints])
+        np.testing.assert_allclose(poses[:, :3], [dp.pos for dp in datapoints])
+        np.testing.assert_allclose(poses[:, 3:], [dp.ori.as_quat() for dp in datapoints])
+        assert sidecar.time_range(frame) == (datapoints[0].timestamp, datapoints[-1].timestamp)
+
+    timestamps, _ = sidecar.get_trajectory(hand[0].frame, start_time=0.1, end_time=0.2)
+    np.testing.assert_allclose(timestamps, [0.1, 0.2])
+    with pytest.raises(KeyError):
+        sidecar.get_trajectory("http://knowrob.org/kb/ameva_log.owl#Plate")
+
+
+def test_empty_sidecar(tmp_path):
+    with TrajectoryWriter(str(tmp_path)):
+        pass
+    sidecar = TrajectorySidecar(str(tmp_path))
+    assert sidecar.frames == []
+    assert sidecar.poses.shape == (0, 7)
@@ -0,0 +1,78 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from vr_neem_converter.windowing import TimelineStitcher, event_windows, fill_segments
+
+LOOKAHEAD = 0.2
+
+
+def _random_events(rng: random.Random, num_events: int) -> list:
+    """
+    (start time, end time, IRI of the known action or None for a state), sorted by start time as by
+    VRNEEMConverter._event_index. Times are rounded to produce shared event times and empty intervals.
+    """
+    events = []
+    for i in range(num_events):
+        start_time = round(rng.uniform(0.0, 60.0), 1)
+        end_time = round(start_time + rng.choice([0.0, rng.uniform(0.0, 2.0), rng.uniform(0.0, 20.0)]), 1)
+        events.append((start_time, end_time, f"Action_{i}" if rng.random() < 0.3 else None))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def _action_times(events: list) -> dict:
+    return {action_iri: {"start_time": start_time, "end_time": end_time}
+            for start_time, end_time, action_iri in events if action_iri is not None}
+
+
+def _actions(segments: list) -> list:
+    # Anonymous actions are identified by their segment
+    return [action_iri if action_iri is not None else f"Anonymous_{start_time}_{end_time}"
+            for action_iri, start_time, end_time in segments]
+
+
+def _single_pass(events: list) -> list:
+    # As VRNEEMConverter._assert_events
+    event_times = sorted({t for start_time, end_time, _ in events for t in (start_time, end_time)})
+    return _actions(fill_segments(_action_times(events), event_times))
+
+
+def _windowed(events: list, window_size: float) -> list:
+    """
+    As VRNEEMConverter._assert_events_windowed. Also check that each action is only released once all events which
+    start before its end time plus the lookahead have been added.
+    """
+    stitcher = TimelineStitcher(LOOKAHEAD)
+    action_ends = {}
+    all_actions = []
+    released = []
+    for window_end, first, last in event_windows([event[0] for event in events], window_size):
+        window_events = events[first:last]
+        stitcher.add([t for start_time, end_time, _ in window_events for t in (start_time, end_time)],
+                     _action_times(window_events))
+        segment_times = stitcher.close_segments(window_end)
+        segments = fill_segments(stitcher.known_actions, segment_times)
+        actions = _actions(segments)
+        for action_iri, (known_iri, _, segment_end) in zip(actions, segments):
+            action_ends[action_iri] = stitcher.known_actions[known_iri]["end_time"] if known_iri is not None \
+                else segment_end
+        stitcher.add_actions(actions, segment_times)
+        all_actions += actions
+        for action_iri in stitcher.ready_actions(window_end):
+            assert action_ends[action_iri] + LOOKAHEAD < window_end
+            released.append(action_iri)
+    assert Counter(released) == Counter(all_actions)
+    return all_actions
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_windowed_actions_match_single_pass(seed):
+    rng = random.Random(seed)
+    events = _random_events(rng, rng.randint(0, 40))
+    window_size = rng.choice([0.5, 2.0, 5.0, 15.0, 100.0])
+    assert _windowed(events, window_size) == _single_pass(events)
@@ -1,3 +1,4 @@
 """
 Copyright (C) 2021 ArtiMinds Robotics GmbH
 """
+__version__ = "1.0.0"
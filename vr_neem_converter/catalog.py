@@ -0,0 +1,205 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Optional, List
+
+CATALOG_FILENAME = "neem_catalog.json"
+CATALOG_VERSION = 1
+
+
+class CatalogFile:
+    """
+    A file of a RobCoG VR dump. path is relative to the root of the dump.
+    """
+
+    def __init__(self, path: str, size: int, mtime: float, sha256: str):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.sha256 = sha256
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "size": self.size, "mtime": self.mtime, "sha256": self.sha256}
+
+    @staticmethod
+    def from_dict(d: dict) -> 'CatalogFile':
+        return CatalogFile(d["path"], d["size"], d["mtime"], d["sha256"])
+
+
+class CatalogEpisode:
+    """
+    All files belonging to one recorded demonstration: The MongoDB collection with the TF data (BSON file in the dump),
+    the episode data (ED) ontology and the timeline (TL) HTML visualization. Each of them may be missing.
+    """
+
+    def __init__(self, name: str, collection: CatalogFile = None, event_owl: CatalogFile = None,
+                 timeline_html: CatalogFile = None):
+        self.name = name
+        self.collection = collection
+        self.event_owl = event_owl
+        self.timeline_html = timeline_html
+
+    def to_dict(self) -> dict:
+        return {key: value.to_dict() if value is not None else None for key, value in
+                [("collection", self.collection), ("event_owl", self.event_owl),
+                 ("timeline_html", self.timeline_html)]}
+
+    @staticmethod
+    def from_dict(name: str, d: dict) -> 'CatalogEpisode':
+        return CatalogEpisode(name, **{key: CatalogFile.from_dict(value) if value is not None else None
+                                       for key, value in d.items()})
+
+
+class DumpCatalog:
+    """
+    Index of a RobCoG VR dump directory ('dump' and 'SemLog' subdirs), built with a single walk over the directory.
+    Maps each episode to its collection, event ontology, timeline and the semantic map of the dump.
+    The catalog is cached as JSON in the dump directory; on reload, files are only rehashed if their size or
+    modification time changed. If the dump directory is not writable (e.g. a read-only mount), there is no cache.
+    """
+
+    def __init__(self, vr_neem_dir: str, db_name: Optional[str], semantic_map: Optional[CatalogFile],
+                 episodes: Dict[str, CatalogEpisode]):
+        self.vr_neem_dir = vr_neem_dir
+        self.db_name = db_name
+        self.semantic_map = semantic_map
+        self.episodes = episodes
+
+    @property
+    def dump_dir(self) -> str:
+        return os.path.join(self.vr_neem_dir, "dump")
+
+    def abspath(self, catalog_file: CatalogFile) -> str:
+        return os.path.join(self.vr_neem_dir, catalog_file.path)
+
+    def episode(self, name: str) -> CatalogEpisode:
+        """
+        :raises KeyError: If there is no episode with this name in the dump
+        """
+        try:
+            return self.episodes[name]
+        except KeyError:
+            raise KeyError(f"No episode '{name}' in {self.vr_neem_dir}") from None
+
+    def semantic_map_file(self) -> CatalogFile:
+        """
+        :raises FileNotFoundError: If the dump has no semantic map (*SM.owl)
+        """
+        if self.semantic_map is None:
+            raise FileNotFoundError(f"No semantic map (*SM.owl) in {self.vr_neem_dir}")
+        return self.semantic_map
+
+    def episode_names(self) -> List[str]:
+        return sorted(self.episodes.keys())
+
+    def to_dict(self) -> dict:
+        return {
+            "version": CATALOG_VERSION,
+            "db_name": self.db_name,
+            "semantic_map": self.semantic_map.to_dict() if self.semantic_map is not None else None,
+            "episodes": {name: episode.to_dict() for name, episode in self.episodes.items()}
+        }
+
+    @staticmethod
+    def from_dict(vr_neem_dir: str, d: dict) -> 'DumpCatalog':
+        return DumpCatalog(vr_neem_dir, d["db_name"],
+                           CatalogFile.from_dict(d["semantic_map"]) if d["semantic_map"] is not None else None,
+                           {name: CatalogEpisode.from_dict(name, episode) for name, episode in d["episodes"].items()})
+
+    def save(self, catalog_path: str = None):
+        catalog_path = catalog_path if catalog_path is not None else os.path.join(self.vr_neem_dir, CATALOG_FILENAME)
+        with open(catalog_path, "w") as catalog_file:
+            json.dump(self.to_dict(), catalog_file, indent=2)
+
+    @staticmethod
+    def load_or_build(vr_neem_dir: str, catalog_path: str = None) -> 'DumpCatalog':
+        """
+        Build the catalog for vr_neem_dir, reusing hashes from the cached catalog where possible, and update the cache.
+        """
+        catalog_path = catalog_path if catalog_path is not None else os.path.join(vr_neem_dir, CATALOG_FILENAME)
+        cached_files = {}
+        if os.path.exists(catalog_path):
+            try:
+                with open(catalog_path) as catalog_file:
+                    cached_catalog = json.load(catalog_file)
+                if cached_catalog.get("version") == CATALOG_VERSION:
+                    cached = DumpCatalog.from_dict(vr_neem_dir, cached_catalog)
+                    cached_files = {f.path: f for f in cached._files()}
+            except (ValueError, KeyError):
+                print(f"Ignoring invalid catalog cache {catalog_path}")
+        catalog = DumpCatalog.build(vr_neem_dir, cached_files)
+        try:
+            catalog.save(catalog_path)
+        except OSError as e:
+            print(f"Cannot write catalog cache {catalog_path}, continuing without: {e}")
+        return catalog
+
+    @staticmethod
+    def build(vr_neem_dir: str, cached_files: Dict[str, CatalogFile] = None) -> 'DumpCatalog':
+        cached_files = cached_files if cached_files is not None else {}
+
+        def catalog_file(abs_path: str) -> CatalogFile:
+            rel_path = os.path.relpath(abs_path, vr_neem_dir)
+            stat = os.stat(abs_path)
+            cached = cached_files.get(rel_path)
+            if cached is not None and cached.size == stat.st_size and cached.mtime == stat.st_mtime:
+                return cached
+            return CatalogFile(rel_path, stat.st_size, stat.st_mtime, file_sha256(abs_path))
+
+        db_name = None
+        collections = {}  # Maps collection name to CatalogFile of the BSON file
+        event_owls = []  # List of (ED OWL CatalogFile, episode name candidates)
+        timeline_htmls = {}  # Maps path prefix (without "TL.html") to CatalogFile
+        semantic_maps = []
+        dump_dir = os.path.join(vr_neem_dir, "dump")
+        for dirpath, dirnames, filenames in os.walk(vr_neem_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                filepath = os.path.join(dirpath, filename)
+                if os.path.dirname(dirpath) == dump_dir and filename.endswith(".bson"):
+                    collection_name = filename[:-len(".bson")]
+                    if collection_name.endswith(".meta"):
+                        continue
+                    db_name = os.path.basename(dirpath)
+                    collections[collection_name] = catalog_file(filepath)
+                elif filename.endswith("_ED.owl"):
+                    rel_dir = os.path.relpath(dirpath, vr_neem_dir)
+                    candidates = [filename[:-len("_ED.owl")]] + list(reversed(rel_dir.split(os.sep)))
+                    event_owls.append((catalog_file(filepath), candidates))
+                elif filename.endswith("TL.html"):
+                    timeline_htmls[filepath[:-len("TL.html")]] = catalog_file(filepath)
+                elif filename.endswith("SM.owl"):
+                    semantic_maps.append(catalog_file(filepath))
+
+        episodes = {name: CatalogEpisode(name, collection=f) for name, f in collections.items()}
+        for event_owl, candidates in event_owls:
+            # Exact match of the ED file prefix or one of its parent directories with a collection name
+            name = next((candidate for candidate in candidates if candidate in collections), candidates[0])
+            episode = episodes.setdefault(name, CatalogEpisode(name))
+            if episode.event_owl is not None:
+                print(f"Multiple event ontologies for episode {name}: {episode.event_owl.path}, {event_owl.path}")
+                continue
+            episode.event_owl = event_owl
+            episode.timeline_html = timeline_htmls.get(os.path.join(vr_neem_dir, event_owl.path)[:-len("ED.owl")])
+
+        # Prefer the semantic map in SemLog/SemanticMap, as the converter always did
+        semantic_maps.sort(key=lambda f: (not f.path.startswith(os.path.join("SemLog", "SemanticMap")), f.path))
+        semantic_map = semantic_maps[0] if len(semantic_maps) > 0 else None
+        return DumpCatalog(vr_neem_dir, db_name, semantic_map, episodes)
+
+    def _files(self) -> List[CatalogFile]:
+        files = [self.semantic_map] if self.semantic_map is not None else []
+        for episode in self.episodes.values():
+            files.extend(f for f in [episode.collection, episode.event_owl, episode.timeline_html] if f is not None)
+        return files
+
+
+def file_sha256(filepath: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,256 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+import os
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+from vr_neem_converter.catalog import CATALOG_FILENAME
+
+STATUS_FILENAME = "daemon_status.json"
+NUM_RECENT_JOBS = 20
+
+# Converter of the worker process, created once by _init_worker and reused for all jobs of the worker
+_converter = None
+
+
+def _init_worker(config_filepath: str, offline: bool):
+    global _converter
+    from neem_converter import create_converter  # Only the workers need the converter and its dependencies
+    _converter = create_converter(None, config_filepath, offline=offline)
+
+
+def _convert_dump(dump_dir: str, output_dir: str, force: bool, archive: bool,
+                  window_size: Optional[float]) -> List[str]:
+    return _converter.convert(output_dir, force=force, vr_neem_dir=dump_dir, archive=archive, window_size=window_size)
+
+
+def dump_signature(dump_dir: str) -> Tuple[int, int, float]:
+    """
+    (Number of files, total size, latest modification time) of a RobCoG dump, to tell whether it is still being written
+    """
+    num_files, total_size, latest_mtime = 0, 0, 0.0
+    for dirpath, _, filenames in os.walk(dump_dir):
+        for filename in filenames:
+            if filename == CATALOG_FILENAME:
+                continue  # Written by the converter itself
+            stat = os.stat(os.path.join(dirpath, filename))
+            num_files += 1
+            total_size += stat.st_size
+            latest_mtime = max(latest_mtime, stat.st_mtime)
+    return num_files, total_size, latest_mtime
+
+
+class ConversionJob:
+    def __init__(self, dump_dir: str, signature: Tuple[int, int, float]):
+        self.dump_dir = dump_dir
+        self.signature = signature
+        self.queued = time.time()
+        self.started = None  # type: Optional[float]
+        self.finished = None  # type: Optional[float]
+        self.episodes = []  # type: List[str]
+        self.error = None  # type: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(os.path.normpath(self.dump_dir))
+
+    def to_dict(self) -> dict:
+        return {
+            "dump": self.name,
+            "status": "failed" if self.error is not None else "done" if self.finished is not None else "running",
+            "duration": self.finished - self.started if self.finished is not None else None,
+            "episodes": self.episodes,
+            "error": self.error
+        }
+
+
+class ConversionDaemon:
+    """
+    Long-running conversion service. Watches input_dir for RobCoG dumps (subdirectories with a 'dump' directory) and
+    converts each completed dump to output_dir/<dump name>. A dump counts as completed once its files have not changed
+    between two polls; it is converted again if it changes later. A dump is never queued while it is already queued or
+    being converted, as both jobs would write to the same output directory. If it changed in the meantime, it is
+    queued again by the first poll after its job has finished.
+    Jobs are queued and run by at most 'concurrency' worker processes. Each worker keeps its VRNEEMConverter, i.e. the
+    rosprolog and MongoDB connections, the KnowRob class set and the parsed semantic maps, warm across jobs.
+    Queue depth and throughput are reported in a JSON status file.
+    """
+
+    def __init__(self, input_dir: str, output_dir: str, config_filepath: str, concurrency: int = 1,
+                 offline: bool = False, poll_interval: float = 10.0, force: bool = False, archive: bool = False,
+                 status_filepath: str = None, window_size: float = None):
+        if concurrency > 1 and not offline:
+            # All workers would share the episode memory of the same KnowRob instance
+            print("Concurrent conversion is only supported with --offline, using a single worker")
+            concurrency = 1
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.config_filepath = config_filepath
+        self.concurrency = concurrency
+        self.offline = offline
+        self.poll_interval = poll_interval
+        self.force = force
+        self.archive = archive
+        self.window_size = window_size
+        self.status_filepath = status_filepath if status_filepath is not None else os.path.join(output_dir,
+                                                                                                 STATUS_FILENAME)
+        self.executor = None  # type: Optional[ProcessPoolExecutor]
+        self.queue = deque()  # Jobs waiting for a worker
+        self.running = {}  # Future -> ConversionJob
+        self.finished_jobs = deque(maxlen=NUM_RECENT_JOBS)
+        self.num_done = 0
+        self.num_failed = 0
+        self.num_episodes = 0
+        self.busy_time = 0.0  # Sum of job durations
+        self.started = time.time()
+        self.last_seen = {}  # Maps dump dir to signature at the last poll
+        self.last_converted = {}  # Maps dump dir to signature at the time it was queued
+        self.in_flight = set()  # Dump dirs which are queued or being converted
+
+    def run(self, once: bool = False):
+        """
+        Poll for dumps until interrupted.
+        :param once: Only convert the dumps which are already complete, and return when done
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._start_executor()
+        try:
+            while True:
+                self.poll()
+                self._dispatch()
+                self._write_status()
+                if once and len(self.queue) == 0 and len(self.running) == 0 and \
+                        all(signature == self.last_converted.get(dump_dir)
+                            for dump_dir, signature in self.last_seen.items()):
+                    break
+                if len(self.running) > 0:
+                    done, _ = wait(self.running.keys(), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    self._collect(done)
+                else:
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for running jobs...")
+        finally:
+            self.executor.shutdown(wait=True)
+            self._collect([future for future in self.running.keys() if future.done()])
+            self._write_status()
+
+    def poll(self):
+        """
+        Queue the dumps whose files did not change since the last poll, which were not converted in that state and
+        which are neither queued nor being converted
+        """
+        for entry in sorted(os.listdir(self.input_dir)):
+            dump_dir = os.path.join(self.input_dir, entry)
+            if not os.path.isdir(os.path.join(dump_dir, "dump")):
+                continue
+            signature = dump_signature(dump_dir)
+            stable = self.last_seen.get(dump_dir) == signature
+            self.last_seen[dump_dir] = signature
+            if stable and dump_dir not in self.in_flight and self.last_converted.get(dump_dir) != signature:
+                print(f"Queueing {dump_dir}")
+                self.last_converted[dump_dir] = signature
+                self.in_flight.add(dump_dir)
+                self.queue.append(ConversionJob(dump_dir, signature))
+
+    def _start_executor(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_worker,
+                                            initargs=(self.config_filepath, self.offline))
+
+    def _dispatch(self):
+        while len(self.queue) > 0 and len(self.running) < self.concurrency:
+            job = self.queue.popleft()
+            job.started = time.time()
+            output_dir = os.path.join(self.output_dir, job.name)
+            future = self.executor.submit(_convert_dump, job.dump_dir, output_dir, self.force, self.archive,
+                                          self.window_size)
+            self.running[future] = job
+
+    def _collect(self, done_futures):
+        broken = False
+        for future in done_futures:
+            job = self.running.pop(future)
+            self.in_flight.discard(job.dump_dir)
+            job.finished = time.time()
+            self.busy_time += job.finished - job.started
+            try:
+                job.episodes = future.result()
+                self.num_done += 1
+                self.num_episodes += len(job.episodes)
+                print(f"Converted {len(job.episodes)} episodes of {job.dump_dir} in "
+                      f"{job.finished - job.started:.1f} seconds")
+            except Exception as e:
+                job.error = repr(e)
+                self.num_failed += 1
+                broken = broken or isinstance(e, BrokenProcessPool)
+                print(f"Conversion of {job.dump_dir} failed: {job.error}")
+            self.finished_jobs.append(job)
+        if broken:
+            # A worker died (e.g. out of memory), which takes down the whole pool
+            self.executor.shutdown(wait=False)
+            self._start_executor()
+
+    def status(self) -> dict:
+        uptime = time.time() - self.started
+        num_finished = self.num_done + self.num_failed
+        return {
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "uptime": uptime,
+            "concurrency": self.concurrency,
+            "queue_depth": len(self.queue),
+            "queued": [job.name for job in self.queue],
+            "running": [job.name for job in self.running.values()],
+            "jobs_done": self.num_done,
+            "jobs_failed": self.num_failed,
+            "episodes_converted": self.num_episodes,
+            "jobs_per_hour": num_finished / uptime * 3600 if uptime > 0 else 0.0,
+            "episodes_per_hour": self.num_episodes / uptime * 3600 if uptime > 0 else 0.0,
+            "mean_job_duration": self.busy_time / num_finished if num_finished > 0 else None,
+            "recent_jobs": [job.to_dict() for job in reversed(self.finished_jobs)]
+        }
+
+    def _write_status(self):
+        # Write and rename, so that readers never see a partially written file
+        temp_filepath = self.status_filepath + ".tmp"
+        with open(temp_filepath, "w") as status_file:
+            json.dump(self.status(), status_file, indent=2)
+        os.replace(temp_filepath, self.status_filepath)
+
+
+def main(args):
+    daemon = ConversionDaemon(args.input_dir, args.output_dir, args.config_file, concurrency=args.concurrency,
+                              offline=args.offline, poll_interval=args.poll_interval, force=args.force,
+                              archive=args.archive, status_filepath=args.status_file,
+                              window_size=args.window_size)
+    daemon.run(once=args.once)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("input_dir", type=str, help="Directory into which RobCoG dumps are copied")
+    parser.add_argument("output_dir", type=str)
+    parser.add_argument("config_file", type=str)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Maximum number of dumps converted in parallel (only with --offline)")
+    parser.add_argument("--poll_interval", type=float, default=10.0, help="Seconds between scans of input_dir")
+    parser.add_argument("--status_file", type=str,
+                        help=f"Path of the JSON status file (default: output_dir/{STATUS_FILENAME})")
+    parser.add_argument("--force", action="store_true", default=False,
+                        help="Reconvert episodes even if their NEEM is up to date")
+    parser.add_argument("--offline", action="store_true", default=False,
+                        help="Build NEEMs without KnowRob and write them as mongoimport-able JSON files")
+    parser.add_argument("--archive", action="store_true", default=False,
+                        help="Write each NEEM as a zstd-compressed tar archive (<collection>.tar.zst) with an index")
+    parser.add_argument("--window_size", type=float,
+                        help="Convert long episodes in time windows of this many seconds to bound memory usage. "
+                             "Only bounds the memory of live conversion: with --offline, all facts of the episode are "
+                             "kept in memory until it is written")
+    parser.add_argument("--once", action="store_true", default=False,
+                        help="Convert the dumps which are already complete, then exit")
+    main(parser.parse_args())
@@ -25,10 +25,36 @@ class EventConverter:
             "TransportingSituation": self.convert_transporting_action
         }
 
-    def _extract_timestamp(self, timepoint_indi):
+    @staticmethod
+    def _parse_timestamp(timepoint_indi) -> float:
         indi_name = timepoint_indi.name
         return float(indi_name.split("_")[-1])
 
+    def _extract_timestamp(self, timepoint_indi) -> float:
+        """
+        Timestamp of the timepoint, clipped to the time window of the conversion
+        """
+        window_start, window_end = self.parent.time_window
+        return min(max(self._parse_timestamp(timepoint_indi), window_start), window_end)
+
+    def start_time(self, event_indi) -> float:
+        """
+        Start time of the event, clipped to the time window of the conversion; -inf if it has none
+        """
+        if not hasattr(event_indi, "startTime") or len(event_indi.startTime) == 0:
+            return float("-inf")
+        return self._extract_timestamp(event_indi.startTime[0])
+
+    def in_time_window(self, event_indi) -> bool:
+        """
+        Return True if the event overlaps with the time window of the conversion
+        """
+        if not hasattr(event_indi, "startTime") or not hasattr(event_indi, "endTime"):
+            return True
+        window_start, window_end = self.parent.time_window
+        return self._parse_timestamp(event_indi.startTime[0]) < window_end and \
+            self._parse_timestamp(event_indi.endTime[0]) > window_start
+
     def convert(self, event_indi):
         event_class = event_indi.is_a[0]
         return self.evt_converters[event_class.name](event_indi)
@@ -0,0 +1,97 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+import vr_neem_converter
+from vr_neem_converter.neem_archive import read_neem_file
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def converter_version() -> str:
+    """
+    Package version plus a hash of the converter sources, so that any change to the converter invalidates old NEEMs
+    """
+    sha256 = hashlib.sha256()
+    package_dir = Path(vr_neem_converter.__file__).parent
+    for source_path in sorted(package_dir.glob("*.py")):
+        sha256.update(source_path.name.encode())
+        sha256.update(source_path.read_bytes())
+    return f"{vr_neem_converter.__version__}+{sha256.hexdigest()[:12]}"
+
+
+def config_hash(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def create_manifest(inputs: dict, options: dict = None) -> dict:
+    """
+    :param inputs: Maps input name (e.g. 'event_owl') to the hash of the input
+    :param options: Conversion options which change the resulting NEEM
+    """
+    return {
+        "converter_version": converter_version(),
+        "inputs": inputs,
+        "options": options if options is not None else {},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def read_manifest(neem_path: str) -> Optional[dict]:
+    """
+    :param neem_path: NEEM directory or archive
+    """
+    if not os.path.exists(neem_path):
+        return None
+    try:
+        return json.loads(read_neem_file(neem_path, MANIFEST_FILENAME))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_manifest(neem_dir: str, manifest: dict):
+    with open(os.path.join(neem_dir, MANIFEST_FILENAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def manifest_matches(manifest: Optional[dict], other: dict) -> bool:
+    """
+    Return True if both manifests describe a conversion of the same inputs with the same converter and options
+    """
+    if manifest is None:
+        return False
+    return all(manifest.get(key) == other.get(key) for key in ["converter_version", "inputs", "options"])
+
+
+def temp_output_dir(neem_dir: str) -> str:
+    """
+    Return a fresh, empty directory next to neem_dir into which the NEEM can be written before commit_output_dir
+    """
+    neem_dir = os.path.normpath(neem_dir)
+    temp_dir = os.path.join(os.path.dirname(neem_dir), f".{os.path.basename(neem_dir)}.tmp")
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
+    return temp_dir
+
+
+def commit_output_dir(temp_dir: str, neem_dir: str):
+    """
+    Replace neem_dir by temp_dir using renames, so that neem_dir is always either the old or the new, complete NEEM
+    """
+    neem_dir = os.path.normpath(neem_dir)
+    old_dir = os.path.join(os.path.dirname(neem_dir), f".{os.path.basename(neem_dir)}.old")
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(neem_dir):
+        os.rename(neem_dir, old_dir)
+    os.rename(temp_dir, neem_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
@@ -0,0 +1,191 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+import os
+import zipfile
+from typing import Iterator, List, Tuple, Optional
+
+import numpy as np
+
+from vr_neem_converter.neem_archive import is_neem_archive, NEEMArchive
+from vr_neem_converter.skeleton import SkeletonLookup, THUMB_TIP_IDX, INDEX_TIP_IDX
+from vr_neem_converter.trajectory_store import TrajectorySidecar
+
+MOTION_FEATURES_FILENAME = "motion_features.npz"
+MOTION_FEATURES_INDEX_FILENAME = "motion_features.json"
+
+
+def quaternion_multiply(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    """
+    Hamilton product of two arrays of quaternions [qx, qy, qz, qw] of shape (N, 4)
+    """
+    x1, y1, z1, w1 = q1[:, 0], q1[:, 1], q1[:, 2], q1[:, 3]
+    x2, y2, z2, w2 = q2[:, 0], q2[:, 1], q2[:, 2], q2[:, 3]
+    return np.stack([w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+                     w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2], axis=1)
+
+
+def linear_velocity(timestamps: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Velocity [m/s] of shape (N, 3) by finite differences (central in the interior, one-sided at the ends)
+    """
+    if len(timestamps) < 2:
+        return np.zeros((len(timestamps), 3))
+    return np.gradient(positions, timestamps, axis=0)
+
+
+def angular_velocity(timestamps: np.ndarray, orientations: np.ndarray) -> np.ndarray:
+    """
+    Angular velocity [rad/s] in world frame of shape (N, 3), from the rotation between consecutive orientations
+    """
+    velocities = np.zeros((len(timestamps), 3))
+    if len(timestamps) < 2:
+        return velocities
+    q_from = orientations[:-1].copy()
+    q_from[:, :3] *= -1  # Conjugate = inverse for unit quaternions
+    delta = quaternion_multiply(orientations[1:], q_from)
+    delta[delta[:, 3] < 0] *= -1  # Shortest rotation
+    sin_half_angle = np.linalg.norm(delta[:, :3], axis=1)
+    angle = 2 * np.arctan2(sin_half_angle, delta[:, 3])
+    axis = np.divide(delta[:, :3], sin_half_angle[:, np.newaxis], out=np.zeros_like(delta[:, :3]),
+                     where=sin_half_angle[:, np.newaxis] > 1e-12)
+    dt = np.diff(timestamps)
+    rates = np.divide(angle, dt, out=np.zeros_like(angle), where=dt > 0)
+    velocities[:-1] = axis * rates[:, np.newaxis]
+    velocities[-1] = velocities[-2]
+    return velocities
+
+
+def interpolate_positions(timestamps: np.ndarray, traj_timestamps: np.ndarray,
+                          traj_positions: np.ndarray) -> np.ndarray:
+    return np.stack([np.interp(timestamps, traj_timestamps, traj_positions[:, dim]) for dim in range(3)], axis=1)
+
+
+def _write_npz_member(npz_file: zipfile.ZipFile, name: str, shape: Tuple[int, ...], dtype: type,
+                      chunks: Iterator[np.ndarray]):
+    """
+    Write an array to the .npz file chunk by chunk, in the format of np.savez, so that it is never held in memory
+    at once. The chunks are consecutive rows of the array.
+    """
+    with npz_file.open(f"{name}.npy", "w", force_zip64=True) as member:
+        np.lib.format.write_array_header_1_0(member, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                      "fortran_order": False, "shape": shape})
+        for chunk in chunks:
+            member.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+
+def compute_motion_features(neem_dir: str, skeleton: SkeletonLookup, object_iris: List[str]):
+    """
+    Compute derived motion signals from the trajectory sidecar of the NEEM and store them next to it:
+        * linear_velocity, angular_velocity: (N, 3) arrays, row-aligned with the trajectory sidecar
+        * aperture_<i>: Distance between thumb and index fingertip of hand i, at the timestamps of the thumb
+        * hand_object_distance_<i>: (M, K) distances between hand i and each of the K objects, at the timestamps
+          of the hand. Object positions are linearly interpolated.
+    motion_features.json maps hand IRIs to i and lists the K object IRIs.
+    The velocities are computed and written one frame at a time, so that memory usage is bounded by the longest
+    trajectory rather than the whole episode.
+    """
+    sidecar = TrajectorySidecar(neem_dir)
+    frames = sorted(sidecar.frames, key=lambda frame: sidecar.ranges[frame]["offset"])  # In row order
+
+    def velocities(velocity_fn, pose_columns: slice) -> Iterator[np.ndarray]:
+        for frame in frames:
+            timestamps, poses = sidecar.get_trajectory(frame)
+            yield velocity_fn(timestamps, poses[:, pose_columns])
+
+    features = {}
+    object_iris = [object_iri for object_iri in object_iris
+                   if object_iri in sidecar.ranges and object_iri not in skeleton.bones]
+    object_trajs = [sidecar.get_trajectory(object_iri) for object_iri in object_iris]
+    hands = []
+    for hand_idx, hand_iri in enumerate(hand_iri for hand_iri in skeleton.bones.keys() if hand_iri in sidecar.ranges):
+        hands.append(hand_iri)
+        thumb_iri = skeleton.bone_iri(hand_iri, THUMB_TIP_IDX)
+        index_iri = skeleton.bone_iri(hand_iri, INDEX_TIP_IDX)
+        if thumb_iri in sidecar.ranges and index_iri in sidecar.ranges:
+            thumb_timestamps, thumb_poses = sidecar.get_trajectory(thumb_iri)
+            index_timestamps, index_poses = sidecar.get_trajectory(index_iri)
+            index_positions = interpolate_positions(thumb_timestamps, index_timestamps, index_poses[:, :3])
+            features[f"aperture_{hand_idx}_timestamps"] = np.asarray(thumb_timestamps)
+            features[f"aperture_{hand_idx}"] = np.linalg.norm(thumb_poses[:, :3] - index_positions, axis=1)
+
+        hand_timestamps, hand_poses = sidecar.get_trajectory(hand_iri)
+        distances = np.zeros((len(hand_timestamps), len(object_iris)))
+        for object_idx, (object_timestamps, object_poses) in enumerate(object_trajs):
+            object_positions = interpolate_positions(hand_timestamps, object_timestamps, object_poses[:, :3])
+            distances[:, object_idx] = np.linalg.norm(hand_poses[:, :3] - object_positions, axis=1)
+        features[f"hand_object_distance_{hand_idx}_timestamps"] = np.asarray(hand_timestamps)
+        features[f"hand_object_distance_{hand_idx}"] = distances
+
+    with zipfile.ZipFile(os.path.join(neem_dir, MOTION_FEATURES_FILENAME), "w",
+                         compression=zipfile.ZIP_DEFLATED) as npz_file:
+        num_rows = len(sidecar.timestamps)
+        _write_npz_member(npz_file, "linear_velocity", (num_rows, 3), np.float32,
+                          velocities(linear_velocity, slice(0, 3)))
+        _write_npz_member(npz_file, "angular_velocity", (num_rows, 3), np.float32,
+                          velocities(angular_velocity, slice(3, None)))
+        for key, value in features.items():
+            dtype = np.float64 if key.endswith("timestamps") else np.float32
+            _write_npz_member(npz_file, key, value.shape, dtype, [value])
+    with open(os.path.join(neem_dir, MOTION_FEATURES_INDEX_FILENAME), "w") as index_file:
+        json.dump({"hands": hands, "objects": object_iris}, index_file, indent=2)
+
+
+class MotionFeatures:
+    """
+    Read access to the motion features computed by compute_motion_features. neem_dir may also be a NEEM archive.
+    """
+
+    def __init__(self, neem_dir: str):
+        self.sidecar = TrajectorySidecar(neem_dir)
+        if is_neem_archive(neem_dir):
+            archive = NEEMArchive(neem_dir)
+            index = json.loads(archive.read_member(MOTION_FEATURES_INDEX_FILENAME))
+            features_file = archive.open_member(MOTION_FEATURES_FILENAME)
+        else:
+            with open(os.path.join(neem_dir, MOTION_FEATURES_INDEX_FILENAME)) as index_file:
+                index = json.load(index_file)
+            features_file = os.path.join(neem_dir, MOTION_FEATURES_FILENAME)
+        self.hands = index["hands"]  # type: List[str]
+        self.objects = index["objects"]  # type: List[str]
+        with np.load(features_file) as features:
+            self.features = {key: features[key] for key in features.files}
+
+    @staticmethod
+    def _slice(timestamps: np.ndarray, start_time: Optional[float], end_time: Optional[float]) -> slice:
+        lo = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side="left"))
+        hi = len(timestamps) if end_time is None else int(np.searchsorted(timestamps, end_time, side="right"))
+        return slice(lo, hi)
+
+    def velocity(self, frame: str, start_time: float = None,
+                 end_time: float = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (timestamps, linear velocities, angular velocities) of the frame
+        """
+        frame_range = self.sidecar.ranges[frame]
+        offset = frame_range["offset"]
+        timestamps = self.sidecar.timestamps[offset:offset + frame_range["count"]]
+        rows = self._slice(timestamps, start_time, end_time)
+        return timestamps[rows], self.features["linear_velocity"][offset + rows.start:offset + rows.stop], \
+            self.features["angular_velocity"][offset + rows.start:offset + rows.stop]
+
+    def aperture(self, hand_iri: str, start_time: float = None,
+                 end_time: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (timestamps, thumb-index distances) of the hand
+        :raises KeyError: If the thumb and index fingertips of the hand were not extracted
+        """
+        hand_idx = self.hands.index(hand_iri)
+        timestamps = self.features[f"aperture_{hand_idx}_timestamps"]
+        rows = self._slice(timestamps, start_time, end_time)
+        return timestamps[rows], self.features[f"aperture_{hand_idx}"][rows]
+
+    def hand_object_distance(self, hand_iri: str, object_iri: str, start_time: float = None,
+                             end_time: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        hand_idx = self.hands.index(hand_iri)
+        timestamps = self.features[f"hand_object_distance_{hand_idx}_timestamps"]
+        rows = self._slice(timestamps, start_time, end_time)
+        return timestamps[rows], self.features[f"hand_object_distance_{hand_idx}"][rows, self.objects.index(object_iri)]
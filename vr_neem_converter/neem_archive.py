@@ -0,0 +1,291 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import io
+import json
+import os
+import subprocess
+import tarfile
+from typing import Dict, Iterator, List, Optional
+
+from vr_neem_converter.offline_backend import OFFLINE_DUMP_DB
+
+ARCHIVE_SUFFIX = ".tar.zst"
+ARCHIVE_INDEX_SUFFIX = ".index.json"
+ARCHIVE_INDEX_VERSION = 1
+CHUNK_SIZE = 1 << 20
+MAX_HEADER_SIZE = 1 << 16  # Upper bound for the size of tar headers, including PAX extended headers
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("NEEM archives require the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def is_neem_archive(neem_path: str) -> bool:
+    return neem_path.endswith(ARCHIVE_SUFFIX)
+
+
+def neem_archive_path(neem_dir: str) -> str:
+    return os.path.normpath(neem_dir) + ARCHIVE_SUFFIX
+
+
+class ArchiveMember:
+    """
+    A file of a NEEM archive. path is relative to the NEEM directory.
+    Each member (tar header and data) is compressed as a separate zstd frame, which starts at offset in the archive and
+    is frame_size bytes long. After decompression, the data of the file follows header_size bytes of tar header.
+    """
+
+    def __init__(self, path: str, size: int, offset: int, frame_size: int, header_size: int):
+        self.path = path
+        self.size = size
+        self.offset = offset
+        self.frame_size = frame_size
+        self.header_size = header_size
+
+    def to_dict(self) -> dict:
+        return {"size": self.size, "offset": self.offset, "frame_size": self.frame_size,
+                "header_size": self.header_size}
+
+    @staticmethod
+    def from_dict(path: str, d: dict) -> 'ArchiveMember':
+        return ArchiveMember(path, d["size"], d["offset"], d["frame_size"], d["header_size"])
+
+
+def write_neem_archive(neem_dir: str, archive_path: str, compression_level: int = 3):
+    """
+    Stream the NEEM directory into a zstd-compressed tar archive with an index of its members next to it
+    (<archive>.index.json). The archive can be unpacked with standard tools (tar --zstd -xf), which recreates the NEEM
+    directory.
+    Both files are written under temporary names and renamed when complete.
+    """
+    zstd = _zstd()
+    neem_name = os.path.basename(archive_path)[:-len(ARCHIVE_SUFFIX)]
+    compressor = zstd.ZstdCompressor(level=compression_level)
+    members = []
+    uncompressed_size = 0
+    temp_archive_path = archive_path + ".tmp"
+    with open(temp_archive_path, "wb") as archive_file:
+        for dirpath, dirnames, filenames in os.walk(neem_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                filepath = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(filepath, neem_dir).replace(os.sep, "/")
+                stat = os.stat(filepath)
+                tarinfo = tarfile.TarInfo(f"{neem_name}/{rel_path}")
+                tarinfo.size = stat.st_size
+                tarinfo.mtime = int(stat.st_mtime)
+                tarinfo.mode = 0o644
+                header = tarinfo.tobuf(format=tarfile.PAX_FORMAT)
+                padding = b"\0" * (-stat.st_size % tarfile.BLOCKSIZE)
+
+                offset = archive_file.tell()
+                frame = compressor.compressobj()
+                archive_file.write(frame.compress(header))
+                with open(filepath, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        archive_file.write(frame.compress(chunk))
+                archive_file.write(frame.compress(padding))
+                archive_file.write(frame.flush())
+                members.append(ArchiveMember(rel_path, stat.st_size, offset, archive_file.tell() - offset,
+                                             len(header)))
+                uncompressed_size += len(header) + stat.st_size + len(padding)
+
+        # End-of-archive marker (two empty blocks), padded to a full tar record
+        end_of_archive_size = 2 * tarfile.BLOCKSIZE
+        end_of_archive_size += -(uncompressed_size + end_of_archive_size) % tarfile.RECORDSIZE
+        archive_file.write(compressor.compress(b"\0" * end_of_archive_size))
+        archive_size = archive_file.tell()
+
+    index_path = archive_path + ARCHIVE_INDEX_SUFFIX
+    with open(index_path + ".tmp", "w") as index_file:
+        json.dump(_index_dict(neem_name, archive_size, members), index_file, indent=2)
+    os.replace(temp_archive_path, archive_path)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def _index_dict(neem_name: str, archive_size: int, members: List[ArchiveMember]) -> dict:
+    return {
+        "version": ARCHIVE_INDEX_VERSION,
+        "neem": neem_name,
+        "archive_size": archive_size,
+        "members": {member.path: member.to_dict() for member in members}
+    }
+
+
+class NEEMArchive:
+    """
+    Random access to the files of a NEEM archive written by write_neem_archive, without unpacking it.
+    If the index is missing or does not belong to the archive (e.g. because only the archive was copied), it is
+    rebuilt by scanning the archive once.
+    """
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self.neem_name = os.path.basename(archive_path)[:-len(ARCHIVE_SUFFIX)]
+        self.members = self._load_index()  # type: Dict[str, ArchiveMember]
+
+    def _load_index(self) -> Dict[str, ArchiveMember]:
+        index_path = self.archive_path + ARCHIVE_INDEX_SUFFIX
+        try:
+            with open(index_path) as index_file:
+                index = json.load(index_file)
+            if index.get("version") == ARCHIVE_INDEX_VERSION and \
+                    index["archive_size"] == os.path.getsize(self.archive_path):
+                return {path: ArchiveMember.from_dict(path, member) for path, member in index["members"].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+        print(f"Rebuilding index of {self.archive_path}")
+        members = self._scan()
+        try:
+            with open(index_path, "w") as index_file:
+                json.dump(_index_dict(self.neem_name, os.path.getsize(self.archive_path), list(members.values())),
+                          index_file, indent=2)
+        except OSError:
+            pass  # E.g. read-only file system; the index is then rebuilt every time
+        return members
+
+    def _scan(self) -> Dict[str, ArchiveMember]:
+        zstd = _zstd()
+        decompressor = zstd.ZstdDecompressor()
+        members = {}
+        with open(self.archive_path, "rb") as archive_file:
+            pending = b""  # Compressed data which belongs to the next frame
+            offset = 0
+            while True:
+                frame = decompressor.decompressobj()
+                head = b""
+                consumed = 0
+                data = pending
+                while not frame.eof:
+                    if len(data) == 0:
+                        data = archive_file.read(CHUNK_SIZE)
+                        if len(data) == 0:
+                            return members  # End of file (in the middle of a frame if the archive is truncated)
+                    out = frame.decompress(data)
+                    consumed += len(data) - len(frame.unused_data)
+                    data = b""
+                    if len(head) < MAX_HEADER_SIZE:
+                        head += out[:MAX_HEADER_SIZE - len(head)]
+                pending = frame.unused_data
+                tarinfo = _parse_tar_header(head)
+                if tarinfo is None:
+                    return members  # End-of-archive marker
+                rel_path = tarinfo.name.split("/", 1)[1]
+                members[rel_path] = ArchiveMember(rel_path, tarinfo.size, offset, consumed, tarinfo.offset_data)
+                offset += consumed
+
+    def has_member(self, path: str) -> bool:
+        return path in self.members
+
+    def member_names(self) -> List[str]:
+        return sorted(self.members.keys())
+
+    def iter_member(self, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Stream the decompressed content of a file of the NEEM, without holding all of it in memory
+        :raises KeyError: If the NEEM has no such file
+        """
+        zstd = _zstd()
+        member = self.members[path]
+        frame = zstd.ZstdDecompressor().decompressobj()
+        to_skip = member.header_size
+        remaining = member.size
+        with open(self.archive_path, "rb") as archive_file:
+            archive_file.seek(member.offset)
+            compressed_remaining = member.frame_size
+            while compressed_remaining > 0 and remaining > 0:
+                data = archive_file.read(min(chunk_size, compressed_remaining))
+                if len(data) == 0:
+                    raise EOFError(f"{self.archive_path} is truncated")
+                compressed_remaining -= len(data)
+                out = frame.decompress(data)
+                if to_skip > 0:
+                    skipped = min(to_skip, len(out))
+                    out = out[skipped:]
+                    to_skip -= skipped
+                out = out[:remaining]
+                remaining -= len(out)
+                if len(out) > 0:
+                    yield out
+
+    def read_member(self, path: str) -> bytes:
+        """
+        :raises KeyError: If the NEEM has no such file
+        """
+        return b"".join(self.iter_member(path))
+
+    def open_member(self, path: str) -> io.BytesIO:
+        return io.BytesIO(self.read_member(path))
+
+    def restore(self, db_name: str = None):
+        """
+        Load the MongoDB collections of the NEEM into MongoDB, streaming them from the archive: BSON files written by
+        mongodump via mongorestore, JSON files written by the offline backend via mongoimport.
+        :param db_name: Database to restore into; by default, the database each collection was dumped from
+        """
+        for path in self.member_names():
+            dirname, filename = os.path.split(path)
+            dump_db_name = os.path.basename(dirname)
+            if filename.endswith(".bson"):
+                collection_name = filename[:-len(".bson")]
+                command = ["mongorestore", "--db", db_name if db_name is not None else dump_db_name,
+                           "--collection", collection_name, "-"]
+            elif filename.endswith(".json") and not filename.endswith(".metadata.json") and dirname == OFFLINE_DUMP_DB:
+                collection_name = filename[:-len(".json")]
+                command = ["mongoimport", "--db", db_name if db_name is not None else dump_db_name,
+                           "--collection", collection_name]
+            else:
+                continue
+            print(f"Restoring {collection_name} from {self.archive_path}")
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            try:
+                for chunk in self.iter_member(path):
+                    process.stdin.write(chunk)
+            finally:
+                process.stdin.close()
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def _parse_tar_header(head: bytes) -> Optional[tarfile.TarInfo]:
+    """
+    Parse the tar header (including PAX extended headers) at the start of head. Return None for the end-of-archive
+    marker.
+    """
+    try:
+        with tarfile.open(fileobj=io.BytesIO(head), mode="r|") as tar:
+            return tar.next()
+    except tarfile.ReadError:  # Raised for an empty header block at the start of the stream
+        return None
+
+
+def read_neem_file(neem_path: str, path: str) -> bytes:
+    """
+    Read a file of a NEEM, which is either a directory or an archive
+    """
+    if is_neem_archive(neem_path):
+        return NEEMArchive(neem_path).read_member(path)
+    with open(os.path.join(neem_path, path), "rb") as f:
+        return f.read()
+
+
+def neem_file_exists(neem_path: str, path: str) -> bool:
+    if is_neem_archive(neem_path):
+        return os.path.exists(neem_path) and NEEMArchive(neem_path).has_member(path)
+    return os.path.exists(os.path.join(neem_path, path))
+
+
+def load_neem(neem_path: str):
+    """
+    Like NEEM.load, but NEEM archives are streamed into MongoDB instead of being unpacked to disk first
+    """
+    from neem_interface_python.neem import NEEM
+    if not is_neem_archive(neem_path):
+        return NEEM.load(neem_path)
+    NEEMArchive(neem_path).restore()
+    return NEEM()
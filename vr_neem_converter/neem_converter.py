@@ -4,24 +4,44 @@ Copyright (C) 2021 ArtiMinds Robotics GmbH
 import json
 import os
 import shutil
+import tempfile
 import time
 from argparse import ArgumentParser
-from pathlib import Path
-from typing import Tuple, List
-
-from knowrob_industrial.utils import resolve_package_urls
-from tqdm import tqdm
-from neem_interface_python.neem_interface import NEEMInterface, Episode
-from neem_interface_python.rosprolog_client import atom
-from neem_interface_python.utils.utils import Datapoint
-from owlready2 import Ontology
-from pymongo import MongoClient
-from pymongo.collection import Collection
-import pybullet as pb
-
-from event_converters import EventConverter
-from vr_neem_converter.utils import load_ontology, assert_agent_and_hand, get_initial_situations, \
-    get_terminal_situations, get_runtime_situations
+from typing import Tuple, List, TYPE_CHECKING
+
+from vr_neem_converter.catalog import DumpCatalog
+from vr_neem_converter.manifest import create_manifest, read_manifest, write_manifest, manifest_matches, \
+    config_hash, temp_output_dir, commit_output_dir
+from vr_neem_converter.neem_archive import neem_archive_path, write_neem_archive
+from vr_neem_converter.offline_backend import OfflineNEEMInterface, OfflineEpisode
+from vr_neem_converter.skeleton import SkeletonLookup, DEFAULT_SKELETON_CONFIG
+from vr_neem_converter.windowing import TimelineStitcher, event_windows, fill_segments, time_windows
+
+# The dependencies of the actual conversion are heavy (rospy, owlready2, pymongo, pybullet, numpy). They are only
+# imported on the code paths which need them, so that --help and episodes which are up to date return quickly.
+if TYPE_CHECKING:
+    from owlready2 import Ontology
+    from pymongo.collection import Collection
+    from vr_neem_converter.timeline_checker import ActionRecord, TimelineReport
+    from vr_neem_converter.trajectory_store import TrajectoryWriter
+
+
+def atom(string: str) -> str:
+    """
+    neem_interface_python's atom, which is imported on first use because its module imports rospy
+    """
+    from neem_interface_python.rosprolog_client import atom as rosprolog_atom
+    return rosprolog_atom(string)
+
+
+def load_ontology_into_new_world(owl_filepath: str, world_filename: str = None) -> 'Ontology':
+    """
+    Load an ontology into a World of its own instead of owlready2's default world, in which ontologies would accumulate.
+    The World is backed by an SQLite file if world_filename is given.
+    """
+    from owlready2 import World
+    from vr_neem_converter.utils import load_ontology
+    return load_ontology(owl_filepath, world=World(filename=world_filename) if world_filename is not None else World())
 
 
 class VRNEEMConverter:
@@ -34,11 +54,25 @@ class VRNEEMConverter:
                  env_urdf="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/urdf/dm_room_vr.urdf",
                  env_urdf_prefix="http://knowrob.org/kb/supermarket.owl",
                  end_effector_class_name="http://knowrob.org/kb/knowrob.owl#GenesisRightHand",
-                 object_urdf_mappings=None):
-        self.neem_interface = NEEMInterface()
+                 object_urdf_mappings=None,
+                 offline=False,
+                 skeleton_config=None,
+                 offline_config=None):
+        """
+        :param skeleton_config: Maps hand class IRIs to maps of bone index to bone class IRI, for the hands and bones
+                                whose TF should be part of the NEEM (see skeleton.py)
+        :param offline: If True, build the NEEM in memory and write it as mongoimport-able files instead of asserting
+                        each fact into KnowRob via rosprolog (see offline_backend.py)
+        :param offline_config: Ontologies and classes known to the offline knowledge base (see OfflineNEEMInterface)
+        """
+        self.offline = offline
+        self.offline_config = offline_config if offline_config is not None else {}
         self.vr_neem_dir = vr_neem_dir
-        self.mongo_client = MongoClient()
+        self._neem_interface = None
+        self._mongo_client = None
+        self.physics_client = None
         self.agent = agent_indi_name
+        self.agent_indi_name = agent_indi_name
         self.end_effector_class_name = end_effector_class_name
         self.agent_owl = agent_owl
         self.agent_urdf = agent_urdf
@@ -49,61 +83,183 @@ class VRNEEMConverter:
         self.all_objects = {}  # Maps object IRI to type
         self.active_objects = {}  # Maps object IRI to type for objects involved in interactions with other objects
         self.object_urdf_mappings = object_urdf_mappings if object_urdf_mappings is not None else {}
+        self.skeleton_config = skeleton_config if skeleton_config is not None else DEFAULT_SKELETON_CONFIG
+        self.skeleton = None
         self.episode = None
-        self.physics_client = pb.connect(pb.DIRECT)
-
-    def convert(self, neem_output_path, episode_name: str = None):
-        db_name = os.listdir(os.path.join(self.vr_neem_dir, "dump"))[0]
-        os.system(f"mongorestore {os.path.join(self.vr_neem_dir, 'dump')}")
-        db = self.mongo_client[db_name]
+        self.time_window = (float("-inf"), float("inf"))  # Only convert data within (start_time, end_time)
+        # Kept across conversions, so that a long-running converter (see conversion_daemon.py) only pays for them once
+        self.known_classes = None  # Set of class IRIs known to KnowRob
+        self.semantic_maps = {}  # Maps SHA256 of semantic map OWL file to loaded semantic map
 
-        all_event_owl_filepaths = list(Path(os.path.join(self.vr_neem_dir, "SemLog", "Episodes")).glob("**/*_ED.owl"))
-        for collection_name in db.list_collection_names():
-            if collection_name.endswith(".meta"):
+    @property
+    def neem_interface(self):
+        """
+        Connection to KnowRob, or the offline knowledge base; created on first use
+        """
+        if self._neem_interface is None:
+            if self.offline:
+                self._neem_interface = OfflineNEEMInterface(self.offline_config)
+            else:
+                from neem_interface_python.neem_interface import NEEMInterface
+                self._neem_interface = NEEMInterface()
+        return self._neem_interface
+
+    @property
+    def mongo_client(self):
+        if self._mongo_client is None:
+            from pymongo import MongoClient
+            self._mongo_client = MongoClient()
+        return self._mongo_client
+
+    @property
+    def episode_cls(self):
+        if self.offline:
+            return OfflineEpisode
+        from neem_interface_python.neem_interface import Episode
+        return Episode
+
+    def convert(self, neem_output_path, episode_name: str = None, force: bool = False, start_time: float = None,
+                end_time: float = None, vr_neem_dir: str = None, archive: bool = False,
+                window_size: float = None) -> List[str]:
+        """
+        Convert all episodes in the VR dump to NEEMs in neem_output_path/<collection name>.
+        Return the names of the converted episodes.
+        Each NEEM gets a manifest with the hashes of its inputs; episodes whose NEEM has a matching manifest are skipped
+        unless force is True.
+        If start_time and/or end_time are given, only TF data and events within this time window are converted, which
+        results in a partial NEEM. It is written to neem_output_path/<collection name>.preview_<start>_<end>, so that it
+        never replaces the complete NEEM.
+        :param episode_name: Only convert the episode with exactly this collection name
+        :param vr_neem_dir: VR dump to convert, if not the one the converter was created for
+        :param archive: Write each NEEM as a compressed archive neem_output_path/<collection name>.tar.zst instead of
+                        a directory (see neem_archive.py)
+        :param window_size: Convert each episode in time windows of this many seconds, so that memory usage depends on
+                            the window size instead of the length of the episode. The NEEM is the same as without
+                            windows (see _convert_windowed).
+        :raises ValueError: If start_time is not before end_time
+        """
+        if start_time is not None and end_time is not None and start_time >= end_time:
+            raise ValueError(f"Start time ({start_time}) must be before end time ({end_time})")
+        self.time_window = (start_time if start_time is not None else float("-inf"),
+                            end_time if end_time is not None else float("inf"))
+        catalog = DumpCatalog.load_or_build(vr_neem_dir if vr_neem_dir is not None else self.vr_neem_dir)
+        db = None  # Restored when the first episode needs to be converted
+        converted_episodes = []
+
+        semantic_map_file = catalog.semantic_map_file()
+        for collection_name in catalog.episode_names() if episode_name is None else [episode_name]:
+            catalog_episode = catalog.episode(collection_name)
+            if catalog_episode.collection is None or catalog_episode.collection.size == 0:
                 continue
-            if episode_name is not None and episode_name not in collection_name:
+            if catalog_episode.event_owl is None:
+                print(f"No event data (*_ED.owl) for episode {collection_name}, skipping...")
                 continue
-            documents = list(db[collection_name].find({}))
-            if len(documents) == 0:
+            event_owl_filepath = catalog.abspath(catalog_episode.event_owl)
+
+            neem_dir = os.path.join(neem_output_path, neem_name(collection_name, start_time, end_time))
+            neem_path = neem_archive_path(neem_dir) if archive else neem_dir
+            manifest = create_manifest({
+                "collection": catalog_episode.collection.sha256,
+                "event_owl": catalog_episode.event_owl.sha256,
+                "semantic_map": semantic_map_file.sha256,
+                "config": config_hash(self._config())
+            }, options={"start_time": start_time, "end_time": end_time})
+            if not force and manifest_matches(read_manifest(neem_path), manifest):
+                print(f"NEEM for {collection_name} is up to date, skipping...")
                 continue
 
-            start_time = time.time()
-            episode_output_dir = os.path.join(neem_output_path, collection_name)
-            if os.path.exists(episode_output_dir):
-                shutil.rmtree(episode_output_dir)
-            os.makedirs(episode_output_dir)
+            from vr_neem_converter.motion_features import compute_motion_features
+            from vr_neem_converter.timeline_checker import TIMELINE_REPORT_FILENAME
+            from vr_neem_converter.trajectory_store import TrajectoryWriter
+            if db is None:
+                # Replace the collections of an earlier restore of the dump, which may have changed since then
+                os.system(f"mongorestore --drop {catalog.dump_dir}")
+                db = self.mongo_client[catalog.db_name]
+            semantic_map = self._load_semantic_map(catalog.abspath(semantic_map_file), semantic_map_file.sha256)
 
-            semantic_map_dir = os.path.join(self.vr_neem_dir, "SemLog", "SemanticMap")
-            semantic_map_owl_filename = next(filter(lambda fn: fn.endswith("SM.owl"), os.listdir(semantic_map_dir)))
-            semantic_map_owl_filepath = os.path.join(semantic_map_dir, semantic_map_owl_filename)
+            conversion_start_time = time.time()
+            # Write to a temporary directory and move it into place when done, so that a crash never leaves behind
+            # an incomplete NEEM which looks complete
+            episode_output_dir = temp_output_dir(neem_dir)
 
             # Create new episode and make assertions
-            with Episode(self.neem_interface, "http://www.artiminds.com/kb/artm.owl#PickAndPlaceTask",
-                         self.env_owl,
-                         self.env_indi_name,
-                         self.env_urdf, self.agent_owl, self.agent, self.agent_urdf,
-                         episode_output_dir) as self.episode:
-                event_owl_filepath = list(filter(lambda fp: collection_name in str(fp), all_event_owl_filepaths))[0]
-                self.agent, self.all_objects, self.active_objects = self._assert_objects_and_agent(
-                    semantic_map_owl_filepath, event_owl_filepath.as_posix())
-                self._assert_events(event_owl_filepath.as_posix())
-                self._assert_tf(db[collection_name])
-            print(f"Conversion took {time.time() - start_time:.4f} seconds")
-
-    def _assert_objects_and_agent(self, semantic_map_owl_filepath: str, event_owl_filepath: str) -> Tuple[
-        str, dict, dict]:
-        semantic_map = load_ontology(semantic_map_owl_filepath)
-        print(f"Loading {event_owl_filepath}")
-        event_ontology = load_ontology(event_owl_filepath)
-        known_classes = [x["Class"] for x in self.neem_interface.prolog.all_solutions("is_class(Class)")]
+            with self.episode_cls(self.neem_interface, "http://www.artiminds.com/kb/artm.owl#PickAndPlaceTask",
+                                  self.env_owl,
+                                  self.env_indi_name,
+                                  self.env_urdf, self.agent_owl, self.agent, self.agent_urdf,
+                                  episode_output_dir) as self.episode:
+                if window_size is None:
+                    print(f"Loading {event_owl_filepath}")
+                    # Not the default World, in which the event ontologies of all episodes would accumulate
+                    event_ontology = load_ontology_into_new_world(event_owl_filepath)
+                    self.agent, self.all_objects, self.active_objects = self._assert_objects_and_agent(
+                        semantic_map, event_ontology)
+                    timeline_report = self._assert_events(event_ontology)
+                    with TrajectoryWriter(episode_output_dir) as trajectory_writer:
+                        self._assert_tf(db[collection_name], trajectory_writer)
+                else:
+                    timeline_report = self._convert_windowed(semantic_map, event_owl_filepath, db[collection_name],
+                                                             episode_output_dir, window_size)
+            print(timeline_report.summary())
+            timeline_report.save(os.path.join(episode_output_dir, TIMELINE_REPORT_FILENAME))
+            compute_motion_features(episode_output_dir, self.skeleton, list(self.active_objects.keys()))
+            write_manifest(episode_output_dir, manifest)
+            if archive:
+                write_neem_archive(episode_output_dir, neem_path)
+                shutil.rmtree(episode_output_dir)
+            else:
+                commit_output_dir(episode_output_dir, neem_dir)
+            converted_episodes.append(collection_name)
+            print(f"Conversion took {time.time() - conversion_start_time:.4f} seconds")
+        return converted_episodes
+
+    def _config(self) -> dict:
+        """
+        All settings which influence the content of the NEEMs
+        """
+        return {
+            "agent_owl": self.agent_owl,
+            "agent_indi_name": self.agent_indi_name,
+            "agent_urdf": self.agent_urdf,
+            "env_owl": self.env_owl,
+            "env_indi_name": self.env_indi_name,
+            "env_urdf": self.env_urdf,
+            "env_urdf_prefix": self.env_urdf_prefix,
+            "end_effector_class_name": self.end_effector_class_name,
+            "object_urdf_mappings": self.object_urdf_mappings,
+            "skeleton_config": self.skeleton_config,
+            "offline": self.offline,
+            "offline_config": self.offline_config if self.offline else None
+        }
+
+    def _load_semantic_map(self, semantic_map_owl_filepath: str, sha256: str) -> 'Ontology':
+        """
+        Each semantic map is loaded into a World of its own, so that semantic maps of different dumps with the same base
+        IRI are not merged
+        """
+        if sha256 not in self.semantic_maps:
+            print(f"Loading {semantic_map_owl_filepath}")
+            self.semantic_maps[sha256] = load_ontology_into_new_world(semantic_map_owl_filepath)
+        return self.semantic_maps[sha256]
+
+    def _assert_objects_and_agent(self, semantic_map: 'Ontology', event_ontology: 'Ontology') -> Tuple[str, dict, dict]:
+        from tqdm import tqdm
+        from vr_neem_converter.utils import assert_agent_and_hand
+        if self.known_classes is None:
+            # Queried within the first episode, after the agent and environment ontologies have been loaded
+            self.known_classes = {x["Class"] for x in self.neem_interface.prolog.all_solutions("is_class(Class)")}
         objects = {}
         active_objects = {}
+        unknown_classes = set()
+        num_unknown = 0
 
         for obj_indi in tqdm(semantic_map.individuals()):
             # Assert objects of known types as individuals of that type, else just as dul:'PhysicalObject'
-            if obj_indi.is_a[0].iri in known_classes:
+            if obj_indi.is_a[0].iri in self.known_classes:
                 obj_type = obj_indi.is_a[0].iri
             else:
+                unknown_classes.add(obj_indi.is_a[0].iri)
+                num_unknown += 1
                 obj_type = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#PhysicalObject"
             self.neem_interface.prolog.ensure_once(f"""
                 kb_project([
@@ -124,29 +280,83 @@ class VRNEEMConverter:
             # Assert URDF for objects where we have it
             if obj_type in self.object_urdf_mappings.keys():
                 self._assert_geometry_for_individual(obj_indi.iri, self.object_urdf_mappings[obj_type])
-
-        # Assert hands as end effectors
-        end_effector_class = semantic_map.search_one(iri=self.end_effector_class_name)
-        agent_iri = assert_agent_and_hand(semantic_map, self.neem_interface, self.agent, end_effector_class)
+        if len(unknown_classes) > 0:
+            print(f"Asserted {num_unknown} objects of {len(unknown_classes)} classes not known to KnowRob as "
+                  f"dul:PhysicalObject: {', '.join(sorted(unknown_classes))}")
+
+        # Assert hands as end effectors, with the bones we extract TF for as fingers
+        self.skeleton = SkeletonLookup.compile(self.skeleton_config, semantic_map)
+        hand_class_iris = [self.end_effector_class_name] + [
+            hand_class_iri for hand_class_iri in self.skeleton.hand_classes if hand_class_iri != self.end_effector_class_name]
+        agent_iri = self.agent
+        for hand_class_iri in hand_class_iris:
+            hand_iri = self.skeleton.hand_classes.get(hand_class_iri)
+            finger_iris = self.skeleton.bone_iris(hand_iri) if hand_iri is not None else None
+            agent_iri = assert_agent_and_hand(semantic_map, self.neem_interface, agent_iri,
+                                              semantic_map.search_one(iri=hand_class_iri), finger_iris=finger_iris)
         return agent_iri, objects, active_objects
 
-    def _assert_tf(self, episode_coll: Collection):
+    def _convert_windowed(self, semantic_map: 'Ontology', event_owl_filepath: str, episode_coll: 'Collection',
+                          episode_output_dir: str, window_size: float) -> 'TimelineReport':
+        """
+        Make the assertions of an episode window by window, for recordings which are too long to be held in memory
+        at once:
+            * The event data is loaded into an owlready2 World backed by an SQLite file, and event individuals are
+              only loaded for the window they start in
+            * Events are asserted window by window; the action timeline is stitched across windows by a
+              TimelineStitcher, so that actions and SituationTransitions are the same as with _assert_events
+            * TF data is queried, asserted and written to the trajectory sidecar window by window
+        Return the timeline consistency report.
+        """
+        from vr_neem_converter.trajectory_store import TrajectoryWriter
+        with tempfile.TemporaryDirectory() as world_dir:
+            print(f"Loading {event_owl_filepath}")
+            event_ontology = load_ontology_into_new_world(event_owl_filepath, os.path.join(world_dir, "events.sqlite3"))
+            self.agent, self.all_objects, self.active_objects = self._assert_objects_and_agent(
+                semantic_map, event_ontology)
+            timeline_report = self._assert_events_windowed(event_ontology, window_size)
+            event_ontology.world.close()
+
+        episode_coll.create_index("timestamp")  # For the range query of each window
+        query = self._tf_query()
+        first_document = episode_coll.find_one(query, sort=[("timestamp", 1)])
+        last_document = episode_coll.find_one(query, sort=[("timestamp", -1)])
+        with TrajectoryWriter(episode_output_dir) as trajectory_writer:
+            if first_document is not None:
+                for time_range in time_windows(first_document["timestamp"], last_document["timestamp"], window_size):
+                    self._assert_tf(episode_coll, trajectory_writer, time_range)
+        return timeline_report
+
+    def _tf_query(self, time_range: Tuple[float, float] = None) -> dict:
+        """
+        Query for the TF data within the time window, and within [start, end) of time_range if given
+        """
+        window_start, window_end = self.time_window
+        timestamp_range = {}
+        if time_range is not None:
+            window_start = max(window_start, time_range[0])
+            timestamp_range["$lt"] = time_range[1]
+        if window_start > float("-inf"):
+            timestamp_range["$gte"] = window_start
+        if window_end < float("inf"):
+            timestamp_range["$lte"] = window_end
+        return {"timestamp": timestamp_range} if len(timestamp_range) > 0 else {}
+
+    def _assert_tf(self, episode_coll: 'Collection', trajectory_writer: 'TrajectoryWriter',
+                   time_range: Tuple[float, float] = None):
         """
-        Assert TF data into KnowRob
+        Assert TF data into KnowRob.
+        The same data is also written to the columnar trajectory sidecar of the NEEM (see trajectory_store.py).
+        :param time_range: Only assert the TF data within [start, end)
         """
+        from neem_interface_python.utils.utils import Datapoint
         # Before starting, prepare a map of (short) object name to fully qualified object name
         # This is necessary because the MongoDB contains short names, but I want TF to contain fully qualified names
         object_iris = {fully_qualified_name.split("#")[-1]: fully_qualified_name for fully_qualified_name in
                        self.active_objects.keys()}
 
-        # Also prepare the IRIs of the hand and fingers I care about
-        fully_qualified_hand_iri = next(
-            iri for iri, obj_class in self.all_objects.items() if obj_class == self.end_effector_class_name)
-        thumb_iri = next(iri for iri, obj_class in self.all_objects.items() if "rThumb" in obj_class)
-        index_iri = next(iri for iri, obj_class in self.all_objects.items() if "rIndex" in obj_class)
-
         datapoints = []
-        for document in episode_coll.find():
+        for document in episode_coll.find(self._tf_query(time_range)):
             ts = document["timestamp"]
             # 'individuals' are in world frame
             for obj in document["individuals"]:
@@ -162,64 +372,104 @@ class VRNEEMConverter:
 
             # 'skel_individuals' are the 2 hands
             for hand in document["skel_individuals"]:
-                try:
-                    hand_id = object_iris[hand["id"]]
-                    if hand_id != fully_qualified_hand_iri:  # Don't care about other hand
-                        continue
-                except KeyError:  # Other hand was not in active objects
+                hand_iri = self.skeleton.hand_iri(hand["id"])
+                if hand_iri is None:  # Don't care about this hand
                     continue
 
                 # TF of the hand itself
                 datapoints.append(
-                    Datapoint.from_unreal(ts, hand_id, "world", hand["pose"][:3], hand["pose"][3:]))
-
-                # Just extract the fingers I care about
-                # The hand has 20 bones: Thumb tip is 3, Index tip is 7
-                for bone in hand["bones"]:
-                    if bone["idx"] == 3:
-                        bone_id = thumb_iri
-                    elif bone["idx"] == 7:
-                        bone_id = index_iri
-                    else:
-                        continue
+                    Datapoint.from_unreal(ts, hand_iri, "world", hand["pose"][:3], hand["pose"][3:]))
+
+                # Just extract the bones configured in the skeleton config
+                for bone_iri, bone_pose in self.skeleton.extract_bones(hand_iri, hand["bones"]):
                     datapoints.append(
-                        Datapoint.from_unreal(ts, bone_id, "world", bone["pose"][:3], bone["pose"][3:]))
+                        Datapoint.from_unreal(ts, bone_iri, "world", bone_pose[:3], bone_pose[3:]))
         self.neem_interface.assert_tf_trajectory(datapoints)
+        trajectory_writer.append(datapoints)
 
-    def _assert_events(self, owl_filepath: str):
+    def _assert_events(self, onto: 'Ontology') -> 'TimelineReport':
         """
-        Assert states and actions into KnowRob.
-        :param owl_filepath: Path to OWL file containing event data, e.g. testing/resources/episode_1/set_table_events.owl
+        Assert states and actions into KnowRob and check the consistency of the resulting timeline.
+        :param onto: Ontology with the event data, e.g. loaded from testing/resources/episode_1/set_table_events.owl
         """
-        onto = load_ontology(owl_filepath)
-        event_individuals = set(onto.individuals()).intersection(onto.search(inEpisode="*"))
-        print(f"Asserting state/situation transitions for {len(event_individuals)} event individuals")
+        from event_converters import EventConverter
+        from vr_neem_converter.timeline_checker import check_timeline
         event_converter = EventConverter(self)
-        event_times = self._assert_states(event_converter, event_individuals)
+        event_individuals = set(filter(lambda event_indi: event_converter.in_time_window(event_indi),
+                                       set(onto.individuals()).intersection(onto.search(inEpisode="*"))))
+        print(f"Asserting state/situation transitions for {len(event_individuals)} event individuals")
+        state_intervals = self._assert_states(event_converter, event_individuals)
+        event_times = [t for _, start_time, end_time in state_intervals for t in (start_time, end_time)]
         action_times = self._assert_known_actions(event_converter, event_individuals, event_times)
         event_times = list(set(event_times))    # deduplicate
         event_times.sort()
         all_actions = self._assert_anonymous_actions(event_converter, action_times, event_times)
         print(f"NEEM has {len(all_actions)} actions")
-        self._assert_situation_transition_and_situations_for_actions(all_actions)
+        action_records = self._assert_situation_transition_and_situations_for_actions(all_actions)
+        return check_timeline(action_records, state_intervals)
+
+    def _assert_events_windowed(self, onto: 'Ontology', window_size: float) -> 'TimelineReport':
+        """
+        Like _assert_events, but only the events which start within one window of window_size seconds are loaded and
+        asserted at a time (see windowing.TimelineStitcher).
+        """
+        from event_converters import EventConverter
+        from vr_neem_converter.timeline_checker import check_timeline
+        from vr_neem_converter.utils import TERMINAL_SITUATION_PADDING
+        event_converter = EventConverter(self)
+        start_times, event_iris = self._event_index(event_converter, onto)
+        print(f"Asserting state/situation transitions for {len(event_iris)} event individuals in windows of "
+              f"{window_size} seconds")
+        stitcher = TimelineStitcher(TERMINAL_SITUATION_PADDING)
+        state_intervals = []
+        action_records = []
+        num_actions = 0
+        for window_end, first, last in event_windows(start_times, window_size):
+            event_individuals = [onto.world[event_iri] for event_iri in event_iris[first:last]]
+            window_state_intervals = self._assert_states(event_converter, event_individuals)
+            event_times = [t for _, start_time, end_time in window_state_intervals for t in (start_time, end_time)]
+            action_times = self._assert_known_actions(event_converter, event_individuals, event_times)
+            state_intervals += window_state_intervals
+            stitcher.add(event_times, action_times)
+            segment_times = stitcher.close_segments(window_end)
+            actions = self._assert_anonymous_actions(event_converter, stitcher.known_actions, segment_times)
+            stitcher.add_actions(actions, segment_times)
+            num_actions += len(actions)
+            action_records += self._assert_situation_transition_and_situations_for_actions(
+                stitcher.ready_actions(window_end))
+        print(f"NEEM has {num_actions} actions")
+        return check_timeline(action_records, state_intervals)
+
+    def _event_index(self, event_converter, onto: 'Ontology') -> Tuple[List[float], List[str]]:
+        """
+        Start times and IRIs of the event individuals within the time window, sorted by start time.
+        Only the IRIs are kept, so that the individuals can be loaded again window by window.
+        """
+        index = []
+        for event_indi in onto.individuals():
+            if len(getattr(event_indi, "inEpisode", [])) == 0 or not event_converter.in_time_window(event_indi):
+                continue
+            index.append((event_converter.start_time(event_indi), event_indi.iri))
+        index.sort()
+        return [start_time for start_time, _ in index], [event_iri for _, event_iri in index]
 
-    def _assert_states(self, event_converter, event_individuals) -> List[float]:
+    def _assert_states(self, event_converter, event_individuals) -> List[Tuple[str, float, float]]:
         """
         Assert the state timeline into KnowRob.
         State semantics (see EventConverter):
             * A State is a durative Event (it has a time interval)
             * Multiple Situations may manifestIn a State
             * If a Situation manifestsIn a State, it holds for the entire duration of the State
+        Return (state IRI, start time, end time) for each state.
         """
-        event_times = []
+        state_intervals = []
         # States; each state also has one corresponding Situation with relations and role bindings
         for event_individual in filter(lambda event_indi: event_converter.is_state(event_indi), event_individuals):
             state_iri = event_converter.convert(event_individual)
             res = self.neem_interface.prolog.ensure_once(
                 f"kb_call(has_time_interval({atom(state_iri)}, StartTime, EndTime))")
-            event_times.append(float(res["StartTime"]))
-            event_times.append(float(res["EndTime"]))
-        return event_times
+            state_intervals.append((state_iri, float(res["StartTime"]), float(res["EndTime"])))
+        return state_intervals
 
     def _assert_known_actions(self, event_converter, event_individuals, event_times) -> dict:
         """
@@ -254,16 +504,9 @@ class VRNEEMConverter:
         """
         all_actions = []
         # Anonymous actions for force-dynamic events which don't have actions
-        for i in range(len(event_times) - 1):
-            start_time = event_times[i]
-            end_time = event_times[i + 1]
-            have_action_during_interval = False
-            for action_iri, action_time_dict in action_times.items():
-                if action_time_dict["start_time"] <= start_time and action_time_dict["end_time"] >= end_time:
-                    have_action_during_interval = True
-                    all_actions.append(action_iri)
-                    break
-            if have_action_during_interval:
+        for action_iri, start_time, end_time in fill_segments(action_times, event_times):
+            if action_iri is not None:
+                all_actions.append(action_iri)
                 continue
             # There is a gap in the timeline --> create anonymous action
             action_iri = event_converter.create_anonymous_action(start_time, end_time)
@@ -271,23 +514,18 @@ class VRNEEMConverter:
             print(f"Created anonymous action: {action_iri} ({start_time} -> {end_time})")
         return all_actions
 
-    def _assert_situation_transition_and_situations_for_actions(self, actions: List[str]):
+    def _assert_situation_transition_and_situations_for_actions(self, actions: List[str]) -> List['ActionRecord']:
         """
         Each action has a Situation transition
             * which has N initialSituations, which manifest at start time
             * which has M terminalSituations, which manifest at end time
         Each action also has the situations of the states with which it (fully) overlaps
+        Return an ActionRecord for each action, for the timeline consistency check.
         """
+        from vr_neem_converter.timeline_checker import ActionRecord
+        from vr_neem_converter.utils import get_initial_situations, get_terminal_situations, get_runtime_situations
 
-        # class Action:
-        #     def __init__(self, start_time, end_time, initial_situations, runtime_situations, terminal_situations):
-        #         self.start_time = start_time
-        #         self.end_time = end_time
-        #         self.initial_situations = initial_situations
-        #         self.runtime_situations = runtime_situations
-        #         self.terminal_situations = terminal_situations
-
-        # all_actions = []
+        action_records = []
         for action_iri in actions:
             res = self.neem_interface.prolog.ensure_once(
                 f"kb_call(has_time_interval({atom(action_iri)}, StartTime, EndTime))")
@@ -310,21 +548,11 @@ class VRNEEMConverter:
                 self.neem_interface.prolog.ensure_once(
                     f"kb_project(holds({atom(situation)}, 'http://www.ease-crc.org/ont/SOMA.owl#manifestsIn', {atom(action_iri)}))")
 
-            # all_actions.append(Action(start_time, end_time, situations_initial, situations_runtime, situations_terminal))
-
-        # all_actions.sort(key=lambda act: act.end_time)
-        # for i in range(len(all_actions) - 1):
-        #     current_action = all_actions[i]
-        #     next_action = all_actions[i+1]
-        #     for terminal_sit in current_action.terminal_situations:
-        #         if terminal_sit not in next_action.initial_situations:
-        #             print(f"Terminal situation at {current_action.end_time} missing from initial situations at {next_action.start_time}")
-        #     for initial_sit in next_action.initial_situations:
-        #         if initial_sit not in current_action.terminal_situations:
-        #             print(f"Initial situation at {next_action.start_time} missing from terminal situations at {current_action.end_time}")
+            action_records.append(ActionRecord(action_iri, start_time, end_time, situations_initial,
+                                               situations_terminal))
+        return action_records
 
-
-    def _is_active_object(self, obj_iri: str, event_ontology: Ontology) -> bool:
+    def _is_active_object(self, obj_iri: str, event_ontology: 'Ontology') -> bool:
         """
         Return True if obj_iri is the object of any object property assertion in any event.
         Return False otherwise: The object does not take part in any event
@@ -337,6 +565,11 @@ class VRNEEMConverter:
         return False
 
     def _assert_geometry_for_individual(self, obj_iri: str, urdf_path: str):
+        from knowrob_industrial.utils import resolve_package_urls
+        import pybullet as pb
+        if self.physics_client is None:
+            self.physics_client = pb.connect(pb.DIRECT)
+
         # Assert URDF
         print(f"Asserting URDF for {obj_iri}")
         self.neem_interface.prolog.ensure_once(f"kb_project(has_kinematics_file({atom(obj_iri)}, {atom(urdf_path)}, 'URDF'))")
@@ -361,20 +594,38 @@ class VRNEEMConverter:
         pb.removeBody(body_id)
 
 
-def main(args):
-    with open(args.config_file) as config_file:
+def neem_name(collection_name: str, start_time: float = None, end_time: float = None) -> str:
+    """
+    Name of the NEEM directory of an episode; partial NEEMs of a time window get a name of their own
+    """
+    if start_time is None and end_time is None:
+        return collection_name
+    return f"{collection_name}.preview_{start_time if start_time is not None else 'start'}_" \
+           f"{end_time if end_time is not None else 'end'}"
+
+
+def create_converter(vr_neem_dir: str, config_filepath: str, offline: bool = False) -> VRNEEMConverter:
+    with open(config_filepath) as config_file:
         config = json.load(config_file)
-    neem_converter = VRNEEMConverter(args.vr_neem_dir,
-                                     agent_owl="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/owl/vr_agent.owl",
-                                     agent_indi_name="http://knowrob.org/kb/vr_agent.owl#VRAgent_0",
-                                     agent_urdf="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/urdf/vr_agent.urdf",
-                                     env_owl="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/owl/supermarket.owl",
-                                     env_indi_name="http://knowrob.org/kb/supermarket.owl#Supermarket_VR_0",
-                                     env_urdf="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/urdf/dm_room_vr.urdf",
-                                     env_urdf_prefix="http://knowrob.org/kb/supermarket.owl#",
-                                     end_effector_class_name="http://knowrob.org/kb/knowrob.owl#GenesisRightHand",
-                                     object_urdf_mappings=config["object_urdfs"])
-    neem_converter.convert(args.output_dir, args.episode_name)
+    return VRNEEMConverter(vr_neem_dir,
+                           agent_owl="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/owl/vr_agent.owl",
+                           agent_indi_name="http://knowrob.org/kb/vr_agent.owl#VRAgent_0",
+                           agent_urdf="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/urdf/vr_agent.urdf",
+                           env_owl="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/owl/supermarket.owl",
+                           env_indi_name="http://knowrob.org/kb/supermarket.owl#Supermarket_VR_0",
+                           env_urdf="/home/lab019/alt/catkin_ws/src/ilias/ilias_final_experiments/urdf/dm_room_vr.urdf",
+                           env_urdf_prefix="http://knowrob.org/kb/supermarket.owl#",
+                           end_effector_class_name="http://knowrob.org/kb/knowrob.owl#GenesisRightHand",
+                           object_urdf_mappings=config["object_urdfs"],
+                           offline=offline,
+                           skeleton_config=config.get("skeleton"),
+                           offline_config=config.get("offline"))
+
+
+def main(args):
+    neem_converter = create_converter(args.vr_neem_dir, args.config_file, offline=args.offline)
+    neem_converter.convert(args.output_dir, args.episode_name, force=args.force, start_time=args.start,
+                           end_time=args.end, archive=args.archive, window_size=args.window_size)
 
 
 if __name__ == '__main__':
@@ -382,5 +633,17 @@ if __name__ == '__main__':
     parser.add_argument("vr_neem_dir", type=str)
     parser.add_argument("output_dir", type=str)
     parser.add_argument("config_file", type=str)
-    parser.add_argument("--episode_name", type=str)
+    parser.add_argument("--episode_name", type=str, help="Only convert the episode with exactly this collection name")
+    parser.add_argument("--start", type=float, help="Only convert data after this timestamp (in seconds)")
+    parser.add_argument("--end", type=float, help="Only convert data before this timestamp (in seconds)")
+    parser.add_argument("--force", action="store_true", default=False,
+                        help="Reconvert episodes even if their NEEM is up to date")
+    parser.add_argument("--offline", action="store_true", default=False,
+                        help="Build NEEMs without KnowRob and write them as mongoimport-able JSON files")
+    parser.add_argument("--archive", action="store_true", default=False,
+                        help="Write each NEEM as a zstd-compressed tar archive (<collection>.tar.zst) with an index")
+    parser.add_argument("--window_size", type=float,
+                        help="Convert long episodes in time windows of this many seconds to bound memory usage. "
+                             "Only bounds the memory of live conversion: with --offline, all facts of the episode are "
+                             "kept in memory until it is written")
     main(parser.parse_args())
@@ -0,0 +1,606 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+import os
+import random
+import re
+import string
+import subprocess
+from collections import defaultdict, namedtuple
+from typing import List, Optional, Iterator
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+OWL_NAMED_INDIVIDUAL = "http://www.w3.org/2002/07/owl#NamedIndividual"
+DUL = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"
+SOMA = "http://www.ease-crc.org/ont/SOMA.owl#"
+KNOWROB = "http://knowrob.org/kb/knowrob.owl#"
+KNOWROB_INDUSTRIAL = "http://www.artiminds.com/kb/knowrob_industrial.owl#"
+
+PREFIXES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "dul": DUL,
+    "soma": SOMA,
+    "knowrob": KNOWROB,
+}
+
+# knowrob_industrial predicates which relate objects in a Situation. Offline, they are expanded following the DUL
+# situation pattern into a Description the Situation satisfies. Which Description class knowrob_industrial's rules use
+# has not been checked, so there is no default: the "situation_relations" entry of the offline configuration must map
+# each predicate to a class (see OfflineNEEMInterface), else projecting the predicate fails.
+SITUATION_PREDICATES = ["object_grasped_in_situation", "objects_touch_in_situation", "object_supported_in_situation"]
+
+OFFLINE_DUMP_DB = "roslog"
+
+
+class OfflinePrologException(Exception):
+    pass
+
+
+class Var:
+    __slots__ = ["name"]
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+Compound = namedtuple("Compound", ["functor", "args"])
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<quoted>'(?:[^'\\]|\\.)*')
+    |(?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    |(?P<var>[A-Z_][A-Za-z0-9_]*)
+    |(?P<atom>[a-z][A-Za-z0-9_]*)
+    |(?P<op>=<|>=|=:=|[<>=])
+    |(?P<punct>[()\[\],:])
+)""", re.VERBOSE)
+
+
+def _tokenize(query: str) -> List[tuple]:
+    tokens = []
+    pos = 0
+    query = query.strip().rstrip(".")
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if match is None:
+            if query[pos:].strip() == "":
+                break
+            raise OfflinePrologException(f"Cannot parse query at '{query[pos:pos + 20]}': {query}")
+        pos = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    return tokens
+
+
+class _Parser:
+    """
+    Parser for the subset of Prolog which VRNEEMConverter and EventConverter send to rosprolog:
+    conjunctions of goals over atoms, prefixed atoms (soma:'Shape'), numbers, variables and lists.
+    """
+
+    def __init__(self, query: str):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+        self.num_anonymous_vars = 0
+
+    def _peek(self) -> Optional[tuple]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _peek_value(self) -> Optional[str]:
+        token = self._peek()
+        return token[1] if token is not None else None
+
+    def _next(self) -> tuple:
+        token = self._peek()
+        if token is None:
+            raise OfflinePrologException("Unexpected end of query")
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str):
+        token = self._next()
+        if token[1] != value:
+            raise OfflinePrologException(f"Expected '{value}', got '{token[1]}'")
+
+    def parse_conjunction(self) -> list:
+        goals = [self.parse_goal()]
+        while self._peek_value() == ",":
+            self._next()
+            goals.append(self.parse_goal())
+        return goals
+
+    def parse_goal(self):
+        term = self.parse_term()
+        token = self._peek()
+        if token is not None and token[0] == "op":
+            self._next()
+            return Compound(token[1], [term, self.parse_term()])
+        return term
+
+    def parse_term(self):
+        kind, value = self._next()
+        if kind == "quoted":
+            return value[1:-1].replace("\\'", "'").replace("\\\\", "\\")
+        if kind == "number":
+            return float(value)
+        if kind == "var":
+            if value == "_":
+                self.num_anonymous_vars += 1
+                return Var(f"_G{self.num_anonymous_vars}")
+            return Var(value)
+        if kind == "atom":
+            token = self._peek()
+            if token is not None and token[1] == ":":
+                self._next()
+                local_name = self.parse_term()
+                try:
+                    return PREFIXES[value] + local_name
+                except KeyError:
+                    raise OfflinePrologException(f"Unknown prefix {value}")
+            if token is not None and token[1] == "(":
+                self._next()
+                args = [self.parse_goal()]
+                while self._peek_value() == ",":
+                    self._next()
+                    args.append(self.parse_goal())
+                self._expect(")")
+                return Compound(value, args)
+            return value
+        if value == "[":
+            elements = []
+            if self._peek_value() == "]":
+                self._next()
+                return elements
+            elements.append(self.parse_goal())
+            while self._peek_value() == ",":
+                self._next()
+                elements.append(self.parse_goal())
+            self._expect("]")
+            return elements
+        raise OfflinePrologException(f"Unexpected token '{value}'")
+
+
+class OfflineKnowledgeBase:
+    """
+    In-memory stand-in for the rosprolog client of NEEMInterface (neem_interface.prolog).
+    It interprets the kb_project/kb_call queries issued during conversion against a local triple store, so that no query
+    leaves the process. The collected triples are written out by OfflineNEEMInterface.stop_episode.
+    """
+
+    def __init__(self, ontology_paths: List[str] = None, known_class_iris: List[str] = None,
+                 situation_relations: dict = None):
+        """
+        :param ontology_paths: OWL files whose classes and class hierarchy are known, like the ontologies KnowRob loads
+        :param known_class_iris: Further class IRIs known to KnowRob, e.g. exported by scripts/export_known_classes.py
+        :param situation_relations: Maps knowrob_industrial situation predicates (SITUATION_PREDICATES) to the
+                                    Description class the Situation satisfies
+        """
+        self.ontology_paths = ontology_paths if ontology_paths is not None else []
+        self.known_class_iris = known_class_iris if known_class_iris is not None else []
+        self.situation_relations = situation_relations if situation_relations is not None else {}
+        self.triples = []
+        self._triple_set = set()
+        self._by_subject = defaultdict(list)  # Maps (s, p) to list of o
+        self._by_object = defaultdict(list)  # Maps (p, o) to list of s
+        self.time_intervals = {}  # Maps event IRI to (start_time, end_time)
+        self.states = []
+        self._minted_iris = set()
+        self._world = None
+        self._ancestors = {}  # Cache for ancestors()
+
+    # Triple store ##################################################################################################
+
+    def add_triple(self, s: str, p: str, o):
+        if (s, p, o) in self._triple_set:
+            return
+        self._triple_set.add((s, p, o))
+        self.triples.append((s, p, o))
+        self._by_subject[(s, p)].append(o)
+        self._by_object[(p, o)].append(s)
+
+    def new_iri(self, type_iri: str) -> str:
+        while True:
+            iri = f"{type_iri}_{''.join(random.choices(string.ascii_letters, k=14))}"
+            if iri not in self._minted_iris:
+                self._minted_iris.add(iri)
+                return iri
+
+    def add_individual(self, type_iri: str) -> str:
+        iri = self.new_iri(type_iri)
+        self.add_triple(iri, RDF_TYPE, OWL_NAMED_INDIVIDUAL)
+        self.add_triple(iri, RDF_TYPE, type_iri)
+        return iri
+
+    def set_time_interval(self, event_iri: str, start_time: float, end_time: float):
+        self.time_intervals[event_iri] = (float(start_time), float(end_time))
+
+    def add_state(self, state_iri: str):
+        self.states.append(state_iri)
+
+    def _load_world(self):
+        # Separate owlready2 world, so that classes of the semantic map and event ontologies do not count as known
+        from owlready2 import World
+        from vr_neem_converter.utils import load_ontology
+        self._world = World()
+        for owl_path in self.ontology_paths:
+            try:
+                load_ontology(owl_path, world=self._world)
+            except Exception as e:
+                print(f"Could not load {owl_path} for offline class lookup: {e}")
+
+    def known_classes(self) -> List[str]:
+        if self._world is None:
+            self._load_world()
+        known_classes = [cls.iri for cls in self._world.classes()]
+        return known_classes + sorted(set(self.known_class_iris).difference(known_classes))
+
+    def ancestors(self, iri: str) -> List[str]:
+        """
+        Return iri and all its superclasses (or superproperties) known from the loaded ontologies.
+        """
+        if not isinstance(iri, str):
+            return [iri]
+        if iri not in self._ancestors:
+            if self._world is None:
+                self._load_world()
+            entity = self._world[iri]
+            if entity is None or not hasattr(entity, "ancestors"):
+                self._ancestors[iri] = [iri]
+            else:
+                self._ancestors[iri] = [iri] + sorted(anc.iri for anc in entity.ancestors()
+                                                      if hasattr(anc, "iri") and anc.iri != iri)
+        return self._ancestors[iri]
+
+    # rosprolog client API ##########################################################################################
+
+    def ensure_once(self, query: str) -> dict:
+        for solution in self._query(query):
+            return solution
+        raise OfflinePrologException(f"Query has no solution: {query}")
+
+    def once(self, query: str) -> dict:
+        for solution in self._query(query):
+            return solution
+        return {}
+
+    def all_solutions(self, query: str) -> List[dict]:
+        return list(self._query(query))
+
+    def ensure_all_solutions(self, query: str) -> List[dict]:
+        solutions = self.all_solutions(query)
+        if len(solutions) == 0:
+            raise OfflinePrologException(f"Query has no solution: {query}")
+        return solutions
+
+    # Interpreter ###################################################################################################
+
+    def _query(self, query: str) -> Iterator[dict]:
+        goals = _Parser(query).parse_conjunction()
+        for bindings in self._solve(goals, {}):
+            yield {name: value for name, value in bindings.items() if not name.startswith("_")}
+
+    @staticmethod
+    def _resolve(term, bindings: dict):
+        if isinstance(term, Var):
+            return bindings.get(term.name, term)
+        return term
+
+    def _unify(self, term, value, bindings: dict) -> Optional[dict]:
+        term = self._resolve(term, bindings)
+        if isinstance(term, Var):
+            new_bindings = dict(bindings)
+            new_bindings[term.name] = value
+            return new_bindings
+        return bindings if term == value else None
+
+    def _solve(self, goals: list, bindings: dict) -> Iterator[dict]:
+        if len(goals) == 0:
+            yield bindings
+            return
+        for new_bindings in self._solve_goal(goals[0], bindings):
+            yield from self._solve(goals[1:], new_bindings)
+
+    def _solve_goal(self, goal, bindings: dict) -> Iterator[dict]:
+        if isinstance(goal, list):
+            yield from self._solve(goal, bindings)
+            return
+        if not isinstance(goal, Compound):
+            raise OfflinePrologException(f"Unsupported goal: {goal}")
+        functor, args = goal
+        if functor == "kb_call":
+            yield from self._solve_goal(args[0], bindings)
+        elif functor == "kb_project":
+            projections = args[0] if isinstance(args[0], list) else [args[0]]
+            for projection in projections:
+                bindings = self._project(projection, bindings)
+            yield bindings
+        elif functor == "is_class":
+            for cls in self.known_classes():
+                new_bindings = self._unify(args[0], cls, bindings)
+                if new_bindings is not None:
+                    yield new_bindings
+        elif functor == "is_state":
+            for state in self.states:
+                new_bindings = self._unify(args[0], state, bindings)
+                if new_bindings is not None:
+                    yield new_bindings
+        elif functor == "has_time_interval":
+            event = self._resolve(args[0], bindings)
+            if isinstance(event, Var):
+                intervals = list(self.time_intervals.items())
+            elif event in self.time_intervals:
+                intervals = [(event, self.time_intervals[event])]
+            else:
+                intervals = []
+            for event_iri, (start_time, end_time) in intervals:
+                new_bindings = self._unify(args[0], event_iri, bindings)
+                if new_bindings is not None:
+                    new_bindings = self._unify(args[1], start_time, new_bindings)
+                if new_bindings is not None:
+                    new_bindings = self._unify(args[2], end_time, new_bindings)
+                if new_bindings is not None:
+                    yield new_bindings
+        elif functor in ["holds", "instance_of"]:
+            s, p, o = args if functor == "holds" else [args[0], RDF_TYPE, args[1]]
+            yield from self._solve_triple(s, p, o, bindings)
+        elif functor in ["=<", ">=", "<", ">", "=:=", "="]:
+            lhs = self._resolve(args[0], bindings)
+            rhs = self._resolve(args[1], bindings)
+            if functor == "=":
+                new_bindings = self._unify(args[0], rhs, bindings) if isinstance(lhs, Var) else \
+                    self._unify(args[1], lhs, bindings)
+                if new_bindings is not None:
+                    yield new_bindings
+                return
+            if isinstance(lhs, Var) or isinstance(rhs, Var):
+                raise OfflinePrologException(f"Arguments are not sufficiently instantiated: {goal}")
+            lhs, rhs = float(lhs), float(rhs)
+            if (functor == "=<" and lhs <= rhs) or (functor == ">=" and lhs >= rhs) or \
+                    (functor == "<" and lhs < rhs) or (functor == ">" and lhs > rhs) or \
+                    (functor == "=:=" and lhs == rhs):
+                yield bindings
+        else:
+            raise OfflinePrologException(f"Unsupported goal: {functor}/{len(args)}")
+
+    def _solve_triple(self, s, p, o, bindings: dict) -> Iterator[dict]:
+        s, p, o = (self._resolve(term, bindings) for term in (s, p, o))
+        if isinstance(p, Var):
+            raise OfflinePrologException("Querying triples with unbound predicate is not supported")
+        if not isinstance(s, Var):
+            candidates = [(s, obj) for obj in self._by_subject.get((s, p), [])]
+        elif not isinstance(o, Var):
+            candidates = [(subj, o) for subj in self._by_object.get((p, o), [])]
+        else:
+            candidates = [(subj, obj) for subj, pred, obj in self.triples if pred == p]
+        for subj, obj in candidates:
+            new_bindings = self._unify(s, subj, bindings)
+            if new_bindings is not None:
+                new_bindings = self._unify(o, obj, new_bindings)
+            if new_bindings is not None:
+                yield new_bindings
+
+    def _project(self, projection, bindings: dict) -> dict:
+        if not isinstance(projection, Compound):
+            raise OfflinePrologException(f"Unsupported projection: {projection}")
+        functor = projection.functor
+        args = [self._resolve(arg, bindings) for arg in projection.args]
+        if functor == "new_iri":
+            return self._unify(projection.args[0], self.new_iri(args[1]), bindings)
+        if any(isinstance(arg, Var) for arg in args):
+            raise OfflinePrologException(f"Arguments are not sufficiently instantiated: {projection}")
+        if functor == "is_individual":
+            self.add_triple(args[0], RDF_TYPE, OWL_NAMED_INDIVIDUAL)
+        elif functor == "instance_of":
+            self.add_triple(args[0], RDF_TYPE, args[1])
+        elif functor == "holds":
+            self.add_triple(*args)
+        elif functor == "has_participant":
+            self.add_triple(args[0], DUL + "hasParticipant", args[1])
+        elif functor == "has_time_interval":
+            self.set_time_interval(*args)
+        elif functor == "has_kinematics_file":
+            self.add_triple(args[0], KNOWROB + "hasKinematicsFile", args[1])
+            self.add_triple(args[0], KNOWROB + "hasKinematicsFileFormat", args[2])
+        elif functor in SITUATION_PREDICATES:
+            if functor not in self.situation_relations:
+                raise OfflinePrologException(f"No Description class configured for {functor}; set it in the "
+                                             f"'situation_relations' entry of the offline configuration")
+            # The situation satisfies a Description which classifies the related objects (DUL situation pattern)
+            *objects, situation_iri = args
+            relation_iri = self.add_individual(self.situation_relations[functor])
+            self.add_triple(situation_iri, DUL + "satisfies", relation_iri)
+            for obj in objects:
+                self.add_triple(relation_iri, DUL + "isRelatedToConcept", obj)
+                self.add_triple(situation_iri, DUL + "includesObject", obj)
+        else:
+            raise OfflinePrologException(f"Unsupported projection: {functor}/{len(args)}")
+        return bindings
+
+    # Dump ##########################################################################################################
+
+    def triple_documents(self) -> Iterator[dict]:
+        """
+        Yield the triples (including time intervals) as documents of KnowRob's 'triples' collection.
+        p* and o* contain the superproperties / superclasses known from the ontologies of the episode.
+        """
+        for s, p, o in self.triples:
+            yield self._triple_document(s, p, o)
+        for event_iri, (start_time, end_time) in self.time_intervals.items():
+            interval_iri = self.new_iri(SOMA + "TimeInterval")
+            yield self._triple_document(event_iri, DUL + "hasTimeInterval", interval_iri)
+            yield self._triple_document(interval_iri, RDF_TYPE, SOMA + "TimeInterval")
+            yield self._triple_document(interval_iri, SOMA + "hasIntervalBegin", start_time)
+            yield self._triple_document(interval_iri, SOMA + "hasIntervalEnd", end_time)
+
+    def _triple_document(self, s: str, p: str, o) -> dict:
+        return {
+            "s": s,
+            "p": p,
+            "o": o,
+            "p*": self.ancestors(p),
+            "o*": self.ancestors(o) if p == RDF_TYPE else [o],
+            "graph": "user"
+        }
+
+
+class OfflineNEEMInterface:
+    """
+    Drop-in replacement for the parts of neem_interface_python's NEEMInterface used by VRNEEMConverter and
+    EventConverter. IRIs are minted locally and all facts are collected in memory (see OfflineKnowledgeBase); TF data
+    is streamed to disk. On stop_episode, the episode is written as mongoimport-able JSON files:
+        <neem_dir>/roslog/triples.json, <neem_dir>/roslog/tf.json
+    Use import_offline_neem to load them into the KnowRob MongoDB in one bulk operation per collection.
+    KnowRob knows the classes of all ontologies it loads (SOMA, DUL, knowrob, ...), while the offline knowledge base only
+    knows those of the environment and agent OWL files and of offline_config:
+        * "ontologies": Further OWL files to load, like the ones KnowRob loads
+        * "known_classes": JSON file with the class IRIs known to KnowRob (see scripts/export_known_classes.py)
+        * "situation_relations": See OfflineKnowledgeBase
+    Objects whose class is unknown are asserted as dul:PhysicalObject, without URDF and bounding box.
+    """
+
+    def __init__(self, offline_config: dict = None):
+        self.offline_config = offline_config if offline_config is not None else {}
+        self.prolog = OfflineKnowledgeBase()
+        self.neem_output_dir = None
+        self._tf_file = None
+
+    def _dump_dir(self, neem_output_dir: str) -> str:
+        return os.path.join(neem_output_dir, OFFLINE_DUMP_DB)
+
+    def start_episode(self, task_type: str, env_owl: str, env_owl_ind_name: str, env_urdf: str,
+                      agent_owl: str, agent_owl_ind_name: str, agent_urdf: str, neem_output_dir: str) -> str:
+        known_class_iris = None
+        if "known_classes" in self.offline_config:
+            with open(self.offline_config["known_classes"]) as known_classes_file:
+                known_class_iris = json.load(known_classes_file)
+        elif len(self.offline_config.get("ontologies", [])) == 0:
+            print("Warning: Neither ontologies nor known classes configured for offline conversion, only classes of "
+                  "the environment and agent ontologies are known")
+        self.prolog = OfflineKnowledgeBase(
+            ontology_paths=[env_owl, agent_owl] + self.offline_config.get("ontologies", []),
+            known_class_iris=known_class_iris, situation_relations=self.offline_config.get("situation_relations"))
+        self.neem_output_dir = neem_output_dir
+        os.makedirs(self._dump_dir(neem_output_dir), exist_ok=True)
+        self._tf_file = open(os.path.join(self._dump_dir(neem_output_dir), "tf.json"), "w")
+
+        episode_iri = self.prolog.add_individual(SOMA + "Episode")
+        top_level_action_iri = self.prolog.add_individual(DUL + "Action")
+        task_iri = self.prolog.add_individual(task_type)
+        self.prolog.add_triple(top_level_action_iri, DUL + "executesTask", task_iri)
+        self.prolog.add_triple(episode_iri, DUL + "includesAction", top_level_action_iri)
+        self.prolog.add_triple(episode_iri, DUL + "includesAgent", agent_owl_ind_name)
+        self.prolog.add_triple(episode_iri, DUL + "includesObject", env_owl_ind_name)
+        for indi_iri, urdf in [(env_owl_ind_name, env_urdf), (agent_owl_ind_name, agent_urdf)]:
+            self.prolog.add_triple(indi_iri, KNOWROB + "hasKinematicsFile", urdf)
+            self.prolog.add_triple(indi_iri, KNOWROB + "hasKinematicsFileFormat", "URDF")
+        with open(os.path.join(neem_output_dir, "offline_episode.json"), "w") as meta_file:
+            json.dump({"episode": episode_iri, "top_level_action": top_level_action_iri,
+                       "ontologies": self.prolog.ontology_paths}, meta_file, indent=2)
+        return top_level_action_iri
+
+    def stop_episode(self, neem_output_dir: str = None):
+        neem_output_dir = neem_output_dir if neem_output_dir is not None else self.neem_output_dir
+        self._tf_file.close()
+        with open(os.path.join(self._dump_dir(neem_output_dir), "triples.json"), "w") as triples_file:
+            for document in self.prolog.triple_documents():
+                triples_file.write(json.dumps(document) + "\n")
+
+    def assert_state(self, participants: List[str], start_time: float = None, end_time: float = None,
+                     state_type=SOMA + "State") -> str:
+        state_iri = self.prolog.add_individual(state_type)
+        for participant in participants:
+            self.prolog.add_triple(state_iri, DUL + "hasParticipant", participant)
+        self.prolog.set_time_interval(state_iri, start_time, end_time)
+        self.prolog.add_state(state_iri)
+        return state_iri
+
+    def assert_situation(self, agent_iri: str, involved_objects: List[str],
+                         situation_type=DUL + "Situation") -> str:
+        situation_iri = self.prolog.add_individual(situation_type)
+        self.prolog.add_triple(situation_iri, DUL + "includesAgent", agent_iri)
+        for obj in involved_objects:
+            self.prolog.add_triple(situation_iri, DUL + "includesObject", obj)
+        return situation_iri
+
+    def add_subaction_with_task(self, parent_action, sub_action_type=DUL + "Action", task_type=DUL + "Task",
+                                start_time: float = None, end_time: float = None) -> str:
+        sub_action_iri = self.prolog.add_individual(sub_action_type)
+        task_iri = self.prolog.add_individual(task_type)
+        self.prolog.add_triple(sub_action_iri, DUL + "executesTask", task_iri)
+        self.prolog.add_triple(parent_action, DUL + "hasConstituent", sub_action_iri)
+        if start_time is not None and end_time is not None:
+            self.prolog.set_time_interval(sub_action_iri, start_time, end_time)
+        return sub_action_iri
+
+    def add_participant_with_role(self, action, participant, role_type=DUL + "Role"):
+        role_iri = self.prolog.add_individual(role_type)
+        self.prolog.add_triple(action, DUL + "hasParticipant", participant)
+        self.prolog.add_triple(participant, DUL + "hasRole", role_iri)
+        for task_iri in self.prolog._by_subject.get((action, DUL + "executesTask"), []):
+            self.prolog.add_triple(task_iri, DUL + "isTaskOf", role_iri)
+
+    def assert_agent_with_effector(self, effector_iri: str, agent_type=DUL + "PhysicalAgent",
+                                   agent_iri: str = None) -> str:
+        if agent_iri is None:
+            agent_iri = self.prolog.add_individual(agent_type)
+        self.prolog.add_triple(agent_iri, DUL + "hasComponent", effector_iri)
+        self.prolog.add_triple(effector_iri, RDF_TYPE, SOMA + "PhysicalEffector")
+        return agent_iri
+
+    def assert_tf_trajectory(self, points: list):
+        for point in points:
+            quat = point.ori.as_quat()  # Datapoint.ori is a scipy Rotation
+            self._tf_file.write(json.dumps({
+                "child_frame_id": point.frame,
+                "header": {
+                    "frame_id": point.reference_frame,
+                    "stamp": {"$date": {"$numberLong": str(int(round(point.timestamp * 1000)))}}
+                },
+                "transform": {
+                    "translation": {"x": point.pos[0], "y": point.pos[1], "z": point.pos[2]},
+                    "rotation": {"x": quat[0], "y": quat[1], "z": quat[2], "w": quat[3]}
+                }
+            }) + "\n")
+
+
+class OfflineEpisode:
+    """
+    Counterpart of neem_interface_python's Episode context manager for OfflineNEEMInterface
+    """
+
+    def __init__(self, neem_interface: OfflineNEEMInterface, task_type: str, env_owl: str, env_owl_ind_name: str,
+                 env_urdf: str, agent_owl: str, agent_owl_ind_name: str, agent_urdf: str, neem_output_path: str):
+        self.neem_interface = neem_interface
+        self.task_type = task_type
+        self.env_owl = env_owl
+        self.env_owl_ind_name = env_owl_ind_name
+        self.env_urdf = env_urdf
+        self.agent_owl = agent_owl
+        self.agent_owl_ind_name = agent_owl_ind_name
+        self.agent_urdf = agent_urdf
+        self.neem_output_path = neem_output_path
+        self.top_level_action_iri = None
+
+    def __enter__(self):
+        self.top_level_action_iri = self.neem_interface.start_episode(self.task_type, self.env_owl,
+                                                                      self.env_owl_ind_name, self.env_urdf,
+                                                                      self.agent_owl, self.agent_owl_ind_name,
+                                                                      self.agent_urdf, self.neem_output_path)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.neem_interface.stop_episode(self.neem_output_path)
+
+
+def import_offline_neem(neem_dir: str, db_name: str = OFFLINE_DUMP_DB):
+    """
+    Bulk-load a NEEM written by OfflineNEEMInterface into MongoDB (one mongoimport per collection)
+    """
+    for collection_name in ["triples", "tf"]:
+        subprocess.run(["mongoimport", "--db", db_name, "--collection", collection_name,
+                        "--file", os.path.join(neem_dir, OFFLINE_DUMP_DB, f"{collection_name}.json")], check=True)
@@ -0,0 +1,102 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List, Tuple, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+PACKAGE_DIR = REPO_ROOT / "vr_neem_converter"
+
+# (name, working directory, command line arguments of the Python interpreter, budget in seconds)
+# The budgets include interpreter startup. Regardless of the time, none of them may import any of HEAVY_MODULES.
+ENTRY_POINTS = [
+    ("neem_converter.py --help", PACKAGE_DIR, ["neem_converter.py", "--help"], 0.3),
+    ("conversion_daemon.py --help", PACKAGE_DIR, ["conversion_daemon.py", "--help"], 0.3),
+    ("VRNEEMConverter()", PACKAGE_DIR,
+     ["-c", "from neem_converter import VRNEEMConverter; VRNEEMConverter('.')"], 0.3),
+    ("convert_unreal_pose.py", PACKAGE_DIR / "scripts",
+     ["convert_unreal_pose.py", "100", "200", "300", "0", "0", "0", "1"], 0.2),
+    ("neem_plotter.py --help", REPO_ROOT / "neem_plotter", ["neem_plotter.py", "--help"], 0.5)
+]
+HEAVY_MODULES = ["rospy", "owlready2", "pymongo", "pybullet", "matplotlib", "scipy"]
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(REPO_ROOT)] + [p for p in env.get("PYTHONPATH", "").split(os.pathsep)
+                                                             if len(p) > 0])
+    return env
+
+
+def time_entry_point(cwd: Path, python_args: List[str], repeat: int) -> Tuple[Optional[float], str]:
+    """
+    (Minimum wall-clock time of running the entry point in seconds, "") or, if the entry point fails, (None, its stderr)
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        res = subprocess.run([sys.executable] + python_args, cwd=cwd, env=_env(), stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+        timings.append(time.perf_counter() - start_time)
+        if res.returncode != 0:
+            # A crash before the imports are done would otherwise look fast
+            return None, res.stderr
+    return min(timings), ""
+
+
+def import_times(cwd: Path, python_args: List[str]) -> List[Tuple[float, str, bool]]:
+    """
+    (Cumulative import time in seconds, module, whether it is a top-level import) of every import of the entry point,
+    as reported by -X importtime
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime"] + python_args, cwd=cwd, env=_env(),
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line[len("import time:"):].split("|")
+        # Nested imports are indented by two more spaces per level
+        imports.append((int(cumulative_us) / 1e6, module.strip(), not module.startswith("  ")))
+    return imports
+
+
+def main(args):
+    over_budget = False
+    for name, cwd, python_args, budget in ENTRY_POINTS:
+        budget *= args.budget_scale
+        duration, error = time_entry_point(cwd, python_args, args.repeat)
+        if duration is None:
+            over_budget = True
+            print(f"FAIL {name:<30} exited with an error:")
+            for line in error.splitlines():
+                print(f"       {line}")
+            continue
+        imports = import_times(cwd, python_args)
+        heavy_modules = sorted({module.split(".")[0] for _, module, _ in imports
+                                if module.split(".")[0] in HEAVY_MODULES})
+        ok = duration <= budget and len(heavy_modules) == 0
+        over_budget = over_budget or not ok
+        print(f"{'OK  ' if ok else 'SLOW'} {name:<30} {duration:.3f}s (budget {budget:.3f}s)")
+        if len(heavy_modules) > 0:
+            print(f"       Imports heavy dependencies: {', '.join(heavy_modules)}")
+        if not ok or args.verbose:
+            top_level_imports = sorted((import_time, module) for import_time, module, top_level in imports if top_level)
+            for import_time, module in reversed(top_level_imports[-args.num_imports:]):
+                print(f"       {import_time:.3f}s {module}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Check that the CLI entry points start within their time budget")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per entry point; the fastest counts")
+    parser.add_argument("--budget_scale", type=float, default=1.0, help="Multiply all budgets, for slow machines")
+    parser.add_argument("--num_imports", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--verbose", action="store_true", default=False,
+                        help="List the slowest imports of every entry point, not only of those over budget")
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import io
+import json
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Iterator
+
+from bson import decode_file_iter
+
+from vr_neem_converter.neem_archive import is_neem_archive, NEEMArchive
+from vr_neem_converter.scripts.compare_neem_dumps import load_collection
+from vr_neem_converter.timeline_checker import timeline_from_triples, check_timeline
+
+
+def load_triples(neem_path: Path) -> Iterator[dict]:
+    """
+    Iterate over the 'triples' collection of a NEEM directory or NEEM archive (see neem_archive.py)
+    """
+    if not is_neem_archive(str(neem_path)):
+        yield from load_collection(neem_path, "triples")
+        return
+    archive = NEEMArchive(str(neem_path))
+    for extension in ["bson", "json"]:
+        path = next((path for path in archive.member_names() if path.split("/")[-1] == f"triples.{extension}"), None)
+        if path is None:
+            continue
+        if extension == "bson":
+            yield from decode_file_iter(archive.open_member(path))
+        else:
+            for line in io.TextIOWrapper(archive.open_member(path)):
+                yield json.loads(line)
+        return
+    raise FileNotFoundError(f"No 'triples' collection in {neem_path}")
+
+
+def main(args):
+    actions, states = timeline_from_triples(load_triples(args.neem_path))
+    report = check_timeline(actions, states)
+    print(report.summary())
+    if args.verbose:
+        for violation in report.violations:
+            print(f"[{violation.kind}] {violation.message}: {', '.join(violation.subjects)}")
+    if args.output is not None:
+        report.save(args.output)
+        print(f"Saved timeline report to {args.output}")
+    if not report.is_consistent:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Check the action timeline of a converted NEEM (directory or archive), like "
+                                        "neem_converter.py does during conversion")
+    parser.add_argument("neem_path", type=Path)
+    parser.add_argument("--output", type=str, default=None, help="Save the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Print every violation")
+    main(parser.parse_args())
@@ -1,4 +1,3 @@
-import os
 from math import floor
 import shutil
 from argparse import ArgumentParser
@@ -7,6 +6,7 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 from owlready2 import Ontology, destroy_entity
 
+from vr_neem_converter.catalog import DumpCatalog
 from vr_neem_converter.utils import load_ontology
 
 
@@ -61,14 +61,19 @@ def main(args):
     if args.output_dir_cleaned_vr_demos.exists():
         shutil.rmtree(args.output_dir_cleaned_vr_demos.as_posix())
     shutil.copytree(args.input_dir_vr_demos.as_posix(), args.output_dir_cleaned_vr_demos.as_posix())
-    semantic_map_path = next(args.output_dir_cleaned_vr_demos.glob("**/*_SM.owl"))
-    semantic_map = load_ontology(semantic_map_path)
-    for episode_data_path in args.output_dir_cleaned_vr_demos.glob("**/*_ED.owl"):
-        # Load ontology & html
-        onto = load_ontology(episode_data_path.as_posix())
-        html_path = episode_data_path.as_posix()[:-6] + "TL.html"
-        if not os.path.exists(html_path):
+    catalog = DumpCatalog.load_or_build(args.output_dir_cleaned_vr_demos.as_posix())
+    semantic_map = load_ontology(catalog.abspath(catalog.semantic_map_file()))
+    for episode_name in catalog.episode_names():
+        catalog_episode = catalog.episode(episode_name)
+        if catalog_episode.event_owl is None:
+            continue
+        if catalog_episode.timeline_html is None:
             continue    # For some reason, SC2_HD_4 does not have a timeline
+
+        # Load ontology & html
+        episode_data_path = catalog.abspath(catalog_episode.event_owl)
+        onto = load_ontology(episode_data_path)
+        html_path = catalog.abspath(catalog_episode.timeline_html)
         with open(html_path) as html_file:
             html = html_file.read()
 
@@ -76,7 +81,7 @@ def main(args):
         html = filter_hand_touching_floor(onto, html, semantic_map)
 
         # Save ontology & HTML
-        onto.save(episode_data_path.as_posix())
+        onto.save(episode_data_path)
         with open(html_path, "w") as html_file:
             html_file.write(html)
 
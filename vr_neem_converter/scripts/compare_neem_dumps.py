@@ -0,0 +1,120 @@
+import json
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from pathlib import Path
+from typing import Iterator
+
+from bson import decode_file_iter
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+
+def load_collection(neem_dir: Path, collection_name: str) -> Iterator[dict]:
+    """
+    Iterate over the documents of a collection of a NEEM, either dumped by mongodump (live conversion) or written as
+    mongoimport JSON lines (offline conversion)
+    """
+    bson_filepath = next(neem_dir.glob(f"**/{collection_name}.bson"), None)
+    if bson_filepath is not None:
+        with open(bson_filepath, "rb") as bson_file:
+            yield from decode_file_iter(bson_file)
+        return
+    json_filepath = next(neem_dir.glob(f"**/{collection_name}.json"), None)
+    if json_filepath is None:
+        raise FileNotFoundError(f"No '{collection_name}' collection in {neem_dir}")
+    with open(json_filepath) as json_file:
+        for line in json_file:
+            yield json.loads(line)
+
+
+def _layout(document: dict, prefix="") -> Iterator[str]:
+    """
+    Field paths of a document, with the type of their value, e.g. "header.stamp:dict"
+    """
+    for key, value in sorted(document.items()):
+        if key == "_id":
+            continue
+        if isinstance(value, dict) and not any(k.startswith("$") for k in value.keys()):
+            yield from _layout(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}:{_type_name(value)}"
+
+
+def _type_name(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"  # Numbers are doubles in one dump and ints in the other, depending on the value
+    if isinstance(value, dict):  # MongoDB extended JSON, e.g. {"$date": ...}
+        return "date" if "$date" in value else "dict"
+    return type(value).__name__.replace("datetime", "date")
+
+
+def neem_statistics(neem_dir: Path) -> dict:
+    """
+    IRIs of actions, states, situations etc. are minted independently by both backends, so NEEMs are compared by
+    the number of individuals per type, the number of triples per predicate, the number of TF poses per frame and the
+    number of documents per layout (field paths and value types) of each collection.
+    """
+    type_counts = Counter()
+    predicate_counts = Counter()
+    layout_counts = Counter()
+    for triple in load_collection(neem_dir, "triples"):
+        predicate_counts[triple["p"]] += 1
+        if triple["p"] == RDF_TYPE:
+            type_counts[triple["o"]] += 1
+        layout_counts["triples: " + ", ".join(_layout(triple))] += 1
+    tf_counts = Counter()
+    for doc in load_collection(neem_dir, "tf"):
+        tf_counts[doc["child_frame_id"]] += 1
+        layout_counts["tf: " + ", ".join(_layout(doc))] += 1
+    return {"types": type_counts, "predicates": predicate_counts, "tf": tf_counts, "layout": layout_counts}
+
+
+def load_statistics(path: Path) -> dict:
+    """
+    Statistics of a NEEM directory, or statistics saved with --save_statistics
+    """
+    if path.is_file():
+        with open(path) as statistics_file:
+            return {name: Counter(counts) for name, counts in json.load(statistics_file).items()}
+    return neem_statistics(path)
+
+
+def compare_counters(name: str, live: Counter, offline: Counter) -> int:
+    num_differences = 0
+    for key in sorted(set(live.keys()).union(offline.keys())):
+        if live[key] != offline[key]:
+            print(f"[{name}] {key}: live={live[key]}, offline={offline[key]}")
+            num_differences += 1
+    return num_differences
+
+
+def compare_statistics(live_stats: dict, offline_stats: dict) -> int:
+    return sum(compare_counters(name, live_stats[name], offline_stats.get(name, Counter()))
+               for name in live_stats.keys())
+
+
+def main(args):
+    live_stats = load_statistics(args.live_neem_dir)
+    if args.save_statistics is not None:
+        with open(args.save_statistics, "w") as statistics_file:
+            json.dump(live_stats, statistics_file, indent=2, sort_keys=True)
+        print(f"Saved statistics of {args.live_neem_dir} to {args.save_statistics}")
+    if args.offline_neem_dir is None:
+        return
+    num_differences = compare_statistics(live_stats, load_statistics(args.offline_neem_dir))
+    if num_differences > 0:
+        print(f"NEEMs differ in {num_differences} statistics")
+        sys.exit(1)
+    print("NEEMs are equivalent")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compare a NEEM converted via KnowRob with the same NEEM converted offline")
+    parser.add_argument("live_neem_dir", type=Path, help="NEEM directory, or statistics saved with --save_statistics")
+    parser.add_argument("offline_neem_dir", type=Path, nargs="?", default=None)
+    parser.add_argument("--save_statistics", type=Path, default=None,
+                        help="Save the statistics of live_neem_dir, e.g. as a golden fixture under test/golden")
+    main(parser.parse_args())
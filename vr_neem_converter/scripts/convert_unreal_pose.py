@@ -1,8 +1,5 @@
-import json
 from argparse import ArgumentParser
 
-from scipy.spatial.transform import Rotation
-
 
 def main(args):
     pos_cm = [args.x, args.y, args.z]
@@ -0,0 +1,22 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+from argparse import ArgumentParser
+
+from neem_interface_python.neem_interface import NEEMInterface
+
+
+def main(args):
+    neem_interface = NEEMInterface()
+    class_iris = sorted({x["Class"] for x in neem_interface.prolog.all_solutions("is_class(Class)")})
+    with open(args.output_file, "w") as output_file:
+        json.dump(class_iris, output_file, indent=2)
+    print(f"Exported {len(class_iris)} classes to {args.output_file}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Export the classes known to a running KnowRob, for the 'known_classes' entry "
+                                        "of the offline configuration of neem_converter.py")
+    parser.add_argument("output_file", type=str)
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from owlready2 import Ontology
+
+NUM_HAND_BONES = 20
+
+# Maps hand class IRI to a map of bone index to bone class IRI (or IRI pattern as understood by owlready2's search)
+# The hand has 20 bones: Thumb tip is 3, Index tip is 7
+DEFAULT_SKELETON_CONFIG = {
+    "http://knowrob.org/kb/knowrob.owl#GenesisRightHand": {"3": "*rThumb3", "7": "*rIndex3"}
+}
+THUMB_TIP_IDX = 3
+INDEX_TIP_IDX = 7
+
+
+class SkeletonLookup:
+    """
+    Lookup table from (hand, bone index) to the IRI of the bone individual, compiled once per semantic map.
+    For each hand, bones holds the (bone index, bone IRI) pairs to extract, so that the bones of a skeleton in a TF
+    document can be picked by direct indexing instead of scanning all bones.
+    """
+
+    def __init__(self, hand_classes: Dict[str, str], bones: Dict[str, List[Tuple[int, str]]]):
+        self.hand_classes = hand_classes  # Maps hand class IRI to fully qualified hand IRI
+        self.hand_iris = {hand_iri.split("#")[-1]: hand_iri for hand_iri in hand_classes.values()}  # Short ID to IRI
+        self.bones = bones  # Maps fully qualified hand IRI to list of (bone index, bone IRI)
+
+    @staticmethod
+    def compile(skeleton_config: Dict[str, Dict[str, str]], semantic_map: 'Ontology') -> 'SkeletonLookup':
+        hand_classes = {}
+        bones = {}
+        for hand_class_iri, bone_config in skeleton_config.items():
+            hand_class = semantic_map.search_one(iri=hand_class_iri)
+            if hand_class is None:
+                print(f"Hand class {hand_class_iri} not in semantic map, skipping...")
+                continue
+            hand_indi = semantic_map.search_one(type=hand_class)
+            if hand_indi is None:
+                print(f"No individual of hand class {hand_class_iri} in semantic map, skipping...")
+                continue
+            hand_classes[hand_class_iri] = hand_indi.iri
+            bones[hand_indi.iri] = []
+            for bone_idx, bone_class_pattern in sorted(bone_config.items(), key=lambda item: int(item[0])):
+                bone_idx = int(bone_idx)
+                if not 0 <= bone_idx < NUM_HAND_BONES:
+                    raise ValueError(f"Invalid bone index {bone_idx} for hand {hand_class_iri}")
+                bone_class = semantic_map.search_one(iri=bone_class_pattern)
+                bone_indi = semantic_map.search_one(type=bone_class) if bone_class is not None else None
+                if bone_indi is None:
+                    raise ValueError(f"No individual of bone class {bone_class_pattern} in semantic map")
+                bones[hand_indi.iri].append((bone_idx, bone_indi.iri))
+        return SkeletonLookup(hand_classes, bones)
+
+    def hand_iri(self, hand_id: str) -> Optional[str]:
+        return self.hand_iris.get(hand_id)
+
+    def bone_iris(self, hand_iri: str) -> List[str]:
+        return [bone_iri for _, bone_iri in self.bones[hand_iri]]
+
+    def bone_iri(self, hand_iri: str, bone_idx: int) -> Optional[str]:
+        return next((bone_iri for idx, bone_iri in self.bones[hand_iri] if idx == bone_idx), None)
+
+    def extract_bones(self, hand_iri: str, hand_bones: List[dict]) -> List[Tuple[str, list]]:
+        """
+        Return (bone IRI, pose) for each configured bone of the hand.
+        :param hand_bones: The 'bones' of a 'skel_individuals' entry of a TF document
+        """
+        extracted = []
+        for bone_idx, bone_iri in self.bones[hand_iri]:
+            bone = hand_bones[bone_idx] if bone_idx < len(hand_bones) else None
+            if bone is None or bone["idx"] != bone_idx:
+                # Bones are not stored in index order, fall back to search
+                bone = next((b for b in hand_bones if b["idx"] == bone_idx), None)
+                if bone is None:
+                    continue
+            extracted.append((bone_iri, bone["pose"]))
+        return extracted
@@ -0,0 +1,217 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+from collections import namedtuple
+from operator import attrgetter, eq
+from typing import List, Tuple, Iterable
+
+import numpy as np
+
+TIMELINE_REPORT_FILENAME = "timeline_report.json"
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+DUL = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"
+SOMA = "http://www.ease-crc.org/ont/SOMA.owl#"
+STATE_TYPES = {SOMA + "State", SOMA + "GraspState", SOMA + "ContactState", SOMA + "SupportState"}
+
+# kind is one of "invalid_interval", "gap", "overlap", "uncovered_state", "missing_initial_situation",
+# "missing_terminal_situation"
+TimelineViolation = namedtuple("TimelineViolation", ["kind", "time", "subjects", "message"])
+
+
+class ActionRecord:
+    """
+    An action of the converted timeline with the situations of its SituationTransition
+    """
+    __slots__ = ["iri", "start_time", "end_time", "initial_situations", "terminal_situations"]
+
+    def __init__(self, iri: str, start_time: float, end_time: float, initial_situations: List[str],
+                 terminal_situations: List[str]):
+        self.iri = iri
+        self.start_time = start_time
+        self.end_time = end_time
+        self.initial_situations = initial_situations
+        self.terminal_situations = terminal_situations
+
+
+class TimelineReport:
+    def __init__(self, violations: List[TimelineViolation], num_actions: int, num_states: int):
+        self.violations = violations
+        self.num_actions = num_actions
+        self.num_states = num_states
+
+    @property
+    def is_consistent(self) -> bool:
+        return len(self.violations) == 0
+
+    def summary(self) -> str:
+        counts = {}
+        for violation in self.violations:
+            counts[violation.kind] = counts.get(violation.kind, 0) + 1
+        details = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+        return f"Timeline check ({self.num_actions} actions, {self.num_states} states): " + \
+               (f"{len(self.violations)} violations ({details})" if len(self.violations) > 0 else "consistent")
+
+    def to_dict(self) -> dict:
+        return {"num_actions": self.num_actions, "num_states": self.num_states,
+                "violations": [violation._asdict() for violation in self.violations]}
+
+    def save(self, filepath: str):
+        with open(filepath, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+
+def _invalid_intervals(iris: np.ndarray, starts: np.ndarray, ends: np.ndarray, what: str) -> List[TimelineViolation]:
+    invalid = np.nonzero(ends < starts)[0]
+    return [TimelineViolation("invalid_interval", float(starts[i]), [str(iris[i])],
+                              f"{what} ends ({ends[i]}) before it starts ({starts[i]})") for i in invalid]
+
+
+def check_timeline(actions: List[ActionRecord], states: List[Tuple[str, float, float]],
+                   tolerance: float = 1e-6) -> TimelineReport:
+    """
+    Check the action timeline of a converted NEEM:
+        * Every action and state interval must be valid (start <= end)
+        * Actions must cover the timeline without gaps or overlaps
+        * Every state must lie within the time span of the action timeline
+        * The terminal situations of each action must be the initial situations of the next action and vice versa
+    :param actions: Actions of the episode; duplicates (same IRI) are ignored
+    :param states: (state IRI, start time, end time) of each state
+    """
+    # The first of several actions with the same IRI counts; sorted by end time, then start time
+    unique_actions = list(dict(zip(map(attrgetter("iri"), reversed(actions)), reversed(actions))).values())
+    action_starts = np.array(list(map(attrgetter("start_time"), unique_actions)), dtype=np.float64)
+    action_ends = np.array(list(map(attrgetter("end_time"), unique_actions)), dtype=np.float64)
+    order = np.lexsort((action_starts, action_ends))
+    unique_actions = list(map(unique_actions.__getitem__, order.tolist()))
+    action_starts = action_starts[order]
+    action_ends = action_ends[order]
+    action_iris = np.array(list(map(attrgetter("iri"), unique_actions)), dtype=object)
+    state_iris = np.array([state[0] for state in states], dtype=object)
+    state_starts = np.array([state[1] for state in states], dtype=np.float64)
+    state_ends = np.array([state[2] for state in states], dtype=np.float64)
+
+    violations = _invalid_intervals(action_iris, action_starts, action_ends, "Action")
+    violations += _invalid_intervals(state_iris, state_starts, state_ends, "State")
+
+    # Gaps and overlaps between consecutive actions
+    if len(unique_actions) > 1:
+        deltas = action_starts[1:] - action_ends[:-1]
+        for i in np.nonzero(deltas > tolerance)[0]:
+            violations.append(TimelineViolation("gap", float(action_ends[i]),
+                                                [str(action_iris[i]), str(action_iris[i + 1])],
+                                                f"No action between {action_ends[i]} and {action_starts[i + 1]}"))
+        for i in np.nonzero(deltas < -tolerance)[0]:
+            violations.append(TimelineViolation("overlap", float(action_starts[i + 1]),
+                                                [str(action_iris[i]), str(action_iris[i + 1])],
+                                                f"Actions overlap between {action_starts[i + 1]} and {action_ends[i]}"))
+
+    # States outside of the action timeline
+    if len(unique_actions) > 0 and len(states) > 0:
+        uncovered = np.nonzero((state_starts < action_starts.min() - tolerance) |
+                               (state_ends > action_ends.max() + tolerance))[0]
+        for i in uncovered:
+            violations.append(TimelineViolation("uncovered_state", float(state_starts[i]), [str(state_iris[i])],
+                                                f"State ({state_starts[i]} -> {state_ends[i]}) is not covered by "
+                                                f"actions ({action_starts.min()} -> {action_ends.max()})"))
+
+    # Situation continuity between consecutive actions: the terminal situations of action i must be the initial
+    # situations of action i+1 and vice versa. Most consecutive actions have identical situation lists, which one
+    # list comparison per pair rules out; situation IRIs are only hashed for the remaining pairs.
+    terminal_situations = list(map(attrgetter("terminal_situations"), unique_actions))
+    initial_situations = list(map(attrgetter("initial_situations"), unique_actions))
+    mismatches = [pos for pos, same in enumerate(map(eq, terminal_situations[:-1], initial_situations[1:]))
+                  if not same]
+    missing_initial = []
+    missing_terminal = []
+    for pos in mismatches:
+        current_action, next_action = unique_actions[pos], unique_actions[pos + 1]
+        initial_set = set(next_action.initial_situations)
+        terminal_set = set(current_action.terminal_situations)
+        for situation in current_action.terminal_situations:
+            if situation not in initial_set:
+                missing_initial.append(TimelineViolation(
+                    "missing_initial_situation", current_action.end_time,
+                    [current_action.iri, next_action.iri, str(situation)],
+                    f"Terminal situation at {current_action.end_time} missing from initial situations at "
+                    f"{next_action.start_time}"))
+        for situation in next_action.initial_situations:
+            if situation not in terminal_set:
+                missing_terminal.append(TimelineViolation(
+                    "missing_terminal_situation", next_action.start_time,
+                    [current_action.iri, next_action.iri, str(situation)],
+                    f"Initial situation at {next_action.start_time} missing from terminal situations at "
+                    f"{current_action.end_time}"))
+    violations += missing_initial + missing_terminal
+
+    violations.sort(key=lambda violation: violation.time)
+    return TimelineReport(violations, len(unique_actions), len(states))
+
+
+def timeline_from_triples(triples: Iterable[dict]) -> Tuple[List[ActionRecord], List[Tuple[str, float, float]]]:
+    """
+    Rebuild the input of check_timeline from the documents of the 'triples' collection of a converted NEEM, to check
+    the timeline after conversion (see scripts/check_neem_timeline.py).
+        * Actions are the events in which a SituationTransition manifests; if several do, their situations are merged
+        * States are the individuals of type soma:State or one of its subclasses
+        * Time intervals are read from dul:hasTimeInterval -> soma:hasIntervalBegin / soma:hasIntervalEnd, or from
+          soma:hasIntervalBegin / soma:hasIntervalEnd of the event itself
+    Actions and states without a time interval are skipped.
+    """
+    transitions = set()
+    state_iris = []
+    manifests_in = []  # (SituationTransition or Situation, event)
+    initial_situations = {}  # Maps SituationTransition to its initial situations
+    terminal_situations = {}
+    time_intervals = {}  # Maps event to its time interval
+    interval_begins = {}
+    interval_ends = {}
+    for triple in triples:
+        s, p, o = triple["s"], triple["p"], triple["o"]
+        if p == RDF_TYPE:
+            if o == SOMA + "SituationTransition":
+                transitions.add(s)
+            elif o in STATE_TYPES or not STATE_TYPES.isdisjoint(triple.get("o*", [])):
+                state_iris.append(s)
+        elif p == SOMA + "manifestsIn":
+            manifests_in.append((s, o))
+        elif p == SOMA + "hasInitialSituation":
+            initial_situations.setdefault(s, []).append(o)
+        elif p == SOMA + "hasTerminalSituation":
+            terminal_situations.setdefault(s, []).append(o)
+        elif p == DUL + "hasTimeInterval":
+            time_intervals[s] = o
+        elif p == SOMA + "hasIntervalBegin":
+            interval_begins[s] = float(o)
+        elif p == SOMA + "hasIntervalEnd":
+            interval_ends[s] = float(o)
+
+    def interval(event_iri: str):
+        interval_iri = time_intervals.get(event_iri, event_iri)
+        if interval_iri not in interval_begins or interval_iri not in interval_ends:
+            print(f"Skipping {event_iri}: No time interval")
+            return None
+        return interval_begins[interval_iri], interval_ends[interval_iri]
+
+    state_set = set(state_iris)
+    action_situations = {}  # Maps action to its (initial situations, terminal situations)
+    for transition_iri, event_iri in manifests_in:
+        if transition_iri not in transitions or event_iri in state_set:
+            continue
+        initial, terminal = action_situations.setdefault(event_iri, ([], []))
+        initial += [situation for situation in initial_situations.get(transition_iri, []) if situation not in initial]
+        terminal += [situation for situation in terminal_situations.get(transition_iri, [])
+                     if situation not in terminal]
+
+    actions = []
+    for action_iri, (initial, terminal) in action_situations.items():
+        action_interval = interval(action_iri)
+        if action_interval is not None:
+            actions.append(ActionRecord(action_iri, action_interval[0], action_interval[1], initial, terminal))
+    states = []
+    for state_iri in dict.fromkeys(state_iris):
+        state_interval = interval(state_iri)
+        if state_interval is not None:
+            states.append((state_iri, state_interval[0], state_interval[1]))
+    return actions, states
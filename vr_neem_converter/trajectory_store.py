@@ -0,0 +1,162 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import json
+import os
+from typing import Tuple, Optional
+
+import numpy as np
+
+from vr_neem_converter.neem_archive import is_neem_archive, NEEMArchive
+
+TRAJECTORY_DIRNAME = "trajectories"
+TRAJECTORY_INDEX_FILENAME = "index.json"
+POSE_DIMS = 7  # x, y, z, qx, qy, qz, qw
+
+
+class TrajectoryWriter:
+    """
+    Writes the TF data of an episode to a columnar sidecar next to the NEEM (<episode_output_dir>/trajectories).
+    Layout:
+        * timestamps.npy: float64 array of shape (N,)
+        * poses.npy: float64 array of shape (N, 7), [x, y, z, qx, qy, qz, qw] in world frame
+        * frames.npy: int32 array of shape (N,), index into the frame list of index.json
+        * index.json: list of frame IRIs and, per frame IRI, the row range and time range of its trajectory
+    Rows are grouped by frame and sorted by timestamp within each group, so the trajectory of one object is a contiguous
+    slice of each array. All arrays are plain .npy files and can be loaded with np.load(..., mmap_mode="r").
+    """
+
+    def __init__(self, episode_output_dir: str):
+        self.output_dir = os.path.join(episode_output_dir, TRAJECTORY_DIRNAME)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.frames = []  # Frame IRIs, position in the list is the frame code
+        self._frame_codes = {}  # Maps frame IRI to frame code
+        self._num_rows = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _raw_path(self, frame_code: int) -> str:
+        return os.path.join(self.output_dir, f"frame_{frame_code}.raw")
+
+    def _frame_code(self, frame: str) -> int:
+        try:
+            return self._frame_codes[frame]
+        except KeyError:
+            self._frame_codes[frame] = len(self.frames)
+            self.frames.append(frame)
+            return self._frame_codes[frame]
+
+    def append(self, datapoints: list):
+        """
+        Append a batch of neem_interface_python Datapoints (in world frame) to the sidecar.
+        """
+        if len(datapoints) == 0:
+            return
+        frames = np.fromiter((self._frame_code(dp.frame) for dp in datapoints), dtype=np.int32, count=len(datapoints))
+        # Rows of [timestamp, x, y, z, qx, qy, qz, qw]; Datapoint.ori is a scipy Rotation
+        rows = np.array([[dp.timestamp] + list(dp.pos) + list(dp.ori.as_quat()) for dp in datapoints],
+                        dtype=np.float64)
+        # Datapoints are appended to one raw file per frame in arrival order, and only sorted by time on close(),
+        # one frame at a time, so memory usage is bounded by the longest trajectory rather than the whole episode
+        order = np.argsort(frames, kind="stable")
+        codes, starts = np.unique(frames[order], return_index=True)
+        for code, batch_rows in zip(codes, np.split(order, starts[1:])):
+            with open(self._raw_path(code), "ab") as raw_file:
+                rows[batch_rows].tofile(raw_file)
+        self._num_rows += len(datapoints)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        num_rows = self._num_rows
+        ranges = {}
+        if num_rows == 0:
+            np.save(os.path.join(self.output_dir, "timestamps.npy"), np.zeros((0,), dtype=np.float64))
+            np.save(os.path.join(self.output_dir, "poses.npy"), np.zeros((0, POSE_DIMS), dtype=np.float64))
+            np.save(os.path.join(self.output_dir, "frames.npy"), np.zeros((0,), dtype=np.int32))
+        else:
+            timestamps_out = np.lib.format.open_memmap(os.path.join(self.output_dir, "timestamps.npy"), mode="w+",
+                                                       dtype=np.float64, shape=(num_rows,))
+            poses_out = np.lib.format.open_memmap(os.path.join(self.output_dir, "poses.npy"), mode="w+",
+                                                  dtype=np.float64, shape=(num_rows, POSE_DIMS))
+            frames_out = np.lib.format.open_memmap(os.path.join(self.output_dir, "frames.npy"), mode="w+",
+                                                   dtype=np.int32, shape=(num_rows,))
+
+            # Concatenate the frames in the order of their codes, each sorted by time
+            offset = 0
+            chunk_size = 1 << 20
+            for code, frame in enumerate(self.frames):
+                raw_rows = np.memmap(self._raw_path(code), dtype=np.float64, mode="r").reshape(-1, 1 + POSE_DIMS)
+                count = len(raw_rows)
+                order = np.argsort(raw_rows[:, 0], kind="stable")
+                for chunk_start in range(0, count, chunk_size):
+                    chunk = raw_rows[order[chunk_start:chunk_start + chunk_size]]
+                    timestamps_out[offset + chunk_start:offset + chunk_start + len(chunk)] = chunk[:, 0]
+                    poses_out[offset + chunk_start:offset + chunk_start + len(chunk)] = chunk[:, 1:]
+                frames_out[offset:offset + count] = code
+                ranges[frame] = {"offset": offset, "count": count,
+                                 "start_time": float(timestamps_out[offset]),
+                                 "end_time": float(timestamps_out[offset + count - 1])}
+                offset += count
+                del raw_rows
+                os.remove(self._raw_path(code))
+            for out in [timestamps_out, poses_out, frames_out]:
+                out.flush()
+            del timestamps_out, poses_out, frames_out
+
+        with open(os.path.join(self.output_dir, TRAJECTORY_INDEX_FILENAME), "w") as index_file:
+            json.dump({"num_rows": num_rows, "frames": self.frames, "ranges": ranges}, index_file, indent=2)
+
+
+class TrajectorySidecar:
+    """
+    Read access to the columnar TF sidecar written by TrajectoryWriter. Arrays are memory-mapped, nothing is parsed
+    except the (small) index.
+    neem_dir may also be a NEEM archive (see neem_archive.py), in which case the arrays are read into memory.
+    """
+
+    def __init__(self, neem_dir: str):
+        sidecar_dir = os.path.join(neem_dir, TRAJECTORY_DIRNAME)
+        if is_neem_archive(neem_dir):
+            archive = NEEMArchive(neem_dir)
+            index = json.loads(archive.read_member(f"{TRAJECTORY_DIRNAME}/{TRAJECTORY_INDEX_FILENAME}"))
+        else:
+            archive = None
+            with open(os.path.join(sidecar_dir, TRAJECTORY_INDEX_FILENAME)) as index_file:
+                index = json.load(index_file)
+        self.frames = index["frames"]  # Frame IRIs
+        self.ranges = index["ranges"]  # Maps frame IRI to the row range and time range of its trajectory
+        if archive is not None:
+            self.timestamps = np.load(archive.open_member(f"{TRAJECTORY_DIRNAME}/timestamps.npy"))
+            self.poses = np.load(archive.open_member(f"{TRAJECTORY_DIRNAME}/poses.npy"))
+        elif index["num_rows"] > 0:
+            self.timestamps = np.load(os.path.join(sidecar_dir, "timestamps.npy"), mmap_mode="r")
+            self.poses = np.load(os.path.join(sidecar_dir, "poses.npy"), mmap_mode="r")
+        else:  # np.load cannot memory-map empty arrays
+            self.timestamps = np.zeros((0,), dtype=np.float64)
+            self.poses = np.zeros((0, POSE_DIMS), dtype=np.float64)
+
+    def time_range(self, frame: str) -> Tuple[float, float]:
+        frame_range = self.ranges[frame]
+        return frame_range["start_time"], frame_range["end_time"]
+
+    def get_trajectory(self, frame: str, start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (timestamps, poses) of the given frame in the closed interval [start_time, end_time].
+        timestamps has shape (M,), poses has shape (M, 7). Both are read-only views into the memory-mapped arrays.
+        :raises KeyError: If there is no trajectory for the given frame
+        """
+        frame_range = self.ranges[frame]
+        offset = frame_range["offset"]
+        timestamps = self.timestamps[offset:offset + frame_range["count"]]
+        lo = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side="left"))
+        hi = len(timestamps) if end_time is None else int(np.searchsorted(timestamps, end_time, side="right"))
+        return timestamps[lo:hi], self.poses[offset + lo:offset + hi]
@@ -4,7 +4,7 @@ from typing import List, Tuple
 from knowrob_industrial.utils import resolve_package_urls
 from neem_interface_python.neem_interface import NEEMInterface
 from neem_interface_python.rosprolog_client import atom
-from owlready2 import get_ontology, Ontology, ThingClass
+from owlready2 import get_ontology, Ontology, ThingClass, World
 
 
 def pose_to_knowrob_string(pose: List[float], reference_frame="world") -> str:
@@ -15,36 +15,43 @@ def pose_to_knowrob_string(pose: List[float], reference_frame="world") -> str:
 
 
 def assert_agent_and_hand(semantic_map: Ontology, neem_interface: NEEMInterface, agent_iri: str,
-                          end_effector_class: ThingClass) -> str:
+                          end_effector_class: ThingClass, finger_iris: List[str] = None) -> str:
     """
     Assert meta-information about the hands (e.g. fingers etc.) of the VR avatar
     Assumption: All objects in the semantic map have already been asserted into the knowledge base
+    :param finger_iris: IRIs of the fingers of the hand. If None, the right thumb and index fingertips are used.
     """
     # Hand
     hand_indi = semantic_map.search_one(type=end_effector_class)
     agent_iri = neem_interface.assert_agent_with_effector(hand_indi.iri, agent_iri=agent_iri)
 
     # Fingertips
-    thumb_class = semantic_map.search_one(iri="*rThumb3")
-    thumb_indi = semantic_map.search_one(type=thumb_class)
-    neem_interface.prolog.ensure_once(
-        f"kb_project(holds({atom(hand_indi.iri)}, 'http://www.ease-crc.org/ont/SOMA.owl#hasFinger', {atom(thumb_indi.iri)}))")
-    index_class = semantic_map.search_one(iri="*rIndex3")
-    index_indi = semantic_map.search_one(type=index_class)
-    neem_interface.prolog.ensure_once(
-        f"kb_project(holds({atom(hand_indi.iri)}, 'http://www.ease-crc.org/ont/SOMA.owl#hasFinger', {atom(index_indi.iri)}))")
+    if finger_iris is None:
+        thumb_class = semantic_map.search_one(iri="*rThumb3")
+        index_class = semantic_map.search_one(iri="*rIndex3")
+        finger_iris = [semantic_map.search_one(type=thumb_class).iri, semantic_map.search_one(type=index_class).iri]
+    for finger_iri in finger_iris:
+        neem_interface.prolog.ensure_once(
+            f"kb_project(holds({atom(hand_indi.iri)}, 'http://www.ease-crc.org/ont/SOMA.owl#hasFinger', {atom(finger_iri)}))")
 
     return agent_iri
 
 
-def load_ontology(owl_filepath: str) -> Ontology:
+def load_ontology(owl_filepath: str, world: World = None) -> Ontology:
     temp_file = tempfile.NamedTemporaryFile(suffix='.owl', mode="w+t")
     with open(owl_filepath) as owl_file:
         patched_owl = resolve_package_urls(owl_file.read())
         temp_file.write(patched_owl)
+        temp_file.flush()
+    if world is not None:
+        return world.get_ontology(f"file://{temp_file.name}").load()
     return get_ontology(f"file://{temp_file.name}").load()
 
 
+# Terminal situations of an action are the situations which hold this many seconds after its end
+TERMINAL_SITUATION_PADDING = 0.2
+
+
 def get_initial_situations(neem_interface: NEEMInterface, action_start_time: float, time_padding=0.0) -> List[str]:
     start_time = action_start_time - time_padding
     try:
@@ -55,7 +62,8 @@ def get_initial_situations(neem_interface: NEEMInterface, action_start_time: flo
         return []
 
 
-def get_terminal_situations(neem_interface: NEEMInterface, action_end_time: float, time_padding=0.2) -> List[str]:
+def get_terminal_situations(neem_interface: NEEMInterface, action_end_time: float,
+                            time_padding=TERMINAL_SITUATION_PADDING) -> List[str]:
     end_time = action_end_time + time_padding
     try:
         res = neem_interface.prolog.ensure_all_solutions(f"""is_state(State), has_time_interval(State, StartTime, EndTime),
@@ -0,0 +1,117 @@
+"""
+Copyright (C) 2021 ArtiMinds Robotics GmbH
+"""
+import bisect
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def event_windows(start_times: List[float], window_size: float) -> Iterator[Tuple[float, int, int]]:
+    """
+    Split events, sorted by start time, into windows of window_size seconds.
+    Yield (window end, index of the first event, index after the last event) for each window which contains events,
+    followed by (inf, N, N) to flush the last window. Windows without events are skipped.
+    Events without start time (-inf) fall into the first window.
+    """
+    first = 0
+    while first < len(start_times):
+        next_timed = bisect.bisect_right(start_times, float("-inf"), lo=first)
+        window_start = start_times[next_timed] if next_timed < len(start_times) else 0.0
+        window_end = window_start + window_size
+        last = bisect.bisect_left(start_times, window_end, lo=first)
+        yield window_end, first, last
+        first = last
+    yield float("inf"), len(start_times), len(start_times)
+
+
+def fill_segments(action_times: Dict[str, dict], event_times: List[float]) -> List[Tuple[Optional[str], float, float]]:
+    """
+    Assign an action to each segment between consecutive event_times: the first known action (in the order of
+    action_times, as returned by VRNEEMConverter._assert_known_actions) which covers the segment, or None if there is
+    none, in which case the segment needs an anonymous action.
+    Return (action IRI or None, segment start, segment end) for each segment.
+    """
+    segments = []
+    for start_time, end_time in zip(event_times[:-1], event_times[1:]):
+        action_iri = next((action_iri for action_iri, action_time_dict in action_times.items()
+                           if action_time_dict["start_time"] <= start_time <= end_time <= action_time_dict["end_time"]),
+                          None)
+        segments.append((action_iri, start_time, end_time))
+    return segments
+
+
+def time_windows(start_time: float, end_time: float, window_size: float) -> Iterator[Tuple[float, float]]:
+    """
+    Split [start_time, end_time] into consecutive windows [window start, window end) of window_size seconds
+    """
+    i = 0
+    while start_time + i * window_size <= end_time:
+        yield start_time + i * window_size, start_time + (i + 1) * window_size
+        i += 1
+
+
+class TimelineStitcher:
+    """
+    Rebuilds the action timeline of an episode whose events are asserted window by window, such that it is the same as
+    if all events had been asserted at once (see VRNEEMConverter._assert_events).
+    Each event is asserted in the window which contains its start time, with its full interval. After the events of a
+    window have been added, all event times before the end of the window are known, because no event ends before it
+    starts. The timeline segments between these times are therefore final and can be filled with actions, while the
+    last one of them is carried over as the start of the first segment of the next window.
+    The SituationTransition of an action needs the states at its end time plus lookahead (see
+    utils.get_terminal_situations), which may start in a later window. Actions are therefore held back until that
+    window has been asserted.
+    """
+
+    def __init__(self, lookahead: float):
+        self.lookahead = lookahead
+        self.event_times = set()  # Event times which are not final yet, and the start of the next segment
+        self.closed_until = float("-inf")  # Start of the next segment; all segments before it are final
+        self.known_actions = {}  # type: Dict[str, dict]
+        self.pending_actions = []  # type: List[Tuple[float, str]]
+
+    def add(self, event_times: List[float], action_times: Dict[str, dict]):
+        """
+        Add the event times and known actions (as returned by VRNEEMConverter._assert_known_actions) of a window
+        """
+        for t in event_times:
+            if t < self.closed_until:
+                # Only possible for intervals which end before they start, which the timeline check reports
+                print(f"Event time {t} lies before the already stitched timeline ({self.closed_until}), ignoring it")
+                continue
+            self.event_times.add(t)
+        self.known_actions.update(action_times)
+
+    def close_segments(self, window_end: float) -> List[float]:
+        """
+        Return the sorted event times which delimit the segments that are final once the events which start before
+        window_end have been added. Consecutive times are the start and end of a segment.
+        Known actions which end before the first of these segments are forgotten, as they cannot cover any segment.
+        """
+        final_times = sorted(t for t in self.event_times if t < window_end)
+        if len(final_times) < 2:
+            return []
+        self.event_times.difference_update(final_times[:-1])
+        self.closed_until = final_times[-1]
+        self.known_actions = {action_iri: action_time_dict
+                              for action_iri, action_time_dict in self.known_actions.items()
+                              if action_time_dict["end_time"] >= final_times[0]}
+        return final_times
+
+    def add_actions(self, actions: List[str], segment_times: List[float]):
+        """
+        Add the actions which fill the segments between segment_times, one per segment (as returned by
+        VRNEEMConverter._assert_anonymous_actions)
+        """
+        for action_iri, segment_end in zip(actions, segment_times[1:]):
+            end_time = self.known_actions[action_iri]["end_time"] if action_iri in self.known_actions else segment_end
+            self.pending_actions.append((end_time + self.lookahead, action_iri))
+
+    def ready_actions(self, window_end: float) -> List[str]:
+        """
+        Return (and forget) the actions whose situations are known once the events which start before window_end have
+        been asserted
+        """
+        ready = [action_iri for ready_time, action_iri in self.pending_actions if ready_time < window_end]
+        self.pending_actions = [(ready_time, action_iri) for ready_time, action_iri in self.pending_actions
+                                if ready_time >= window_end]
+        return ready